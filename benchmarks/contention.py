@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+'''
+measures how fast several threads can intern expressions at the same time
+
+every thread builds the same expressions in the same order ("shared", the
+worst case for collisions) or its own expressions ("distinct").  the Fn
+intern table is run with its default number of stripes and with a single
+stripe, which is the same as one lock around the whole table
+'''
+
+import sys
+import threading
+import time
+import weakref
+import symath
+from symath.hashcons import InternTable
+
+def _restripe(table, count):
+  entries = []
+  for lock, results in table.stripes:
+    entries.extend(results.items())
+  table.stripes = [(threading.Lock(), weakref.WeakValueDictionary()) for i in range(count)]
+  for k, v in entries:
+    table.stripes[hash(k) % count][1][k] = v
+
+def _run(nthreads, count, shared):
+  x = symath.symbols('x')
+  heads = [symath.symbols('contention_%d' % (i,)) for i in range(nthreads)]
+  keep = []
+
+  def _build(head):
+    rv = []
+    for i in range(count):
+      rv.append(head(x, i) + i)
+    keep.append(rv)
+
+  threads = [threading.Thread(target=_build, args=(heads[0] if shared else heads[i],))
+      for i in range(nthreads)]
+  start = time.time()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return time.time() - start
+
+def main(count=20000):
+  table = symath.core.Fn.__new__
+  print '%8s %8s %10s %10s %10s' % ('threads', 'stripes', 'mode', 'seconds', 'nodes/s')
+  for stripes in (InternTable.STRIPES, 1):
+    _restripe(table, stripes)
+    for nthreads in (1, 2, 4, 8):
+      for shared in (True, False):
+        t = _run(nthreads, count, shared)
+        nodes = 2 * count * nthreads
+        print '%8d %8d %10s %10.3f %10.0f' % (nthreads, stripes,
+            'shared' if shared else 'distinct', t, nodes / t)
+  _restripe(table, InternTable.STRIPES)
+
+if __name__ == '__main__':
+  main(*map(int, sys.argv[1:]))
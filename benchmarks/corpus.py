@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+'''
+compares a corpus search against a compiled pattern matched on every
+expression
+
+the expressions are sums, products and differences over 40 function symbols
+and 200 symbols, so the head and arity index leaves about a third of them to
+the pattern and the symbol postings about a hundredth.  building the index
+costs about as much as 40 loops over the corpus, it is paid on the first
+search and repays itself over a batch of queries
+'''
+
+import random
+import sys
+import time
+import symath
+from symath.corpus import Corpus
+
+def _corpus(count):
+  rng = random.Random(0)
+  heads = symath.symbols(' '.join('f%d' % (i,) for i in range(40)))
+  syms = symath.symbols(' '.join('x%d' % (i,) for i in range(200)))
+  exps = []
+  for i in range(count):
+    term = rng.choice(heads)(rng.choice(syms), rng.randint(0, 9)) * rng.choice(syms)
+    exps.append(rng.choice([term + i, term * i, term - i]))
+  return exps
+
+def _patterns(count):
+  rng = random.Random(1)
+  a, b, c = symath.wilds('a b c')
+  rv = []
+  for i in range(count):
+    f, x = symath.symbols('f%d x%d' % (rng.randrange(40), rng.randrange(200)))
+    rv.append(f(x, a) * b + c)
+  return rv
+
+def _time(name, fn, *args):
+  start = time.time()
+  rv = fn(*args)
+  print '%-24s %8.3fs %d' % (name, time.time() - start, rv)
+
+def main(count=100000, queries=50, processes=2):
+  exps = _corpus(count)
+  patterns = _patterns(queries)
+
+  def loop(patterns):
+    rv = 0
+    for pattern in patterns:
+      p = symath.match.compile(pattern)
+      rv += sum(1 for e in exps if p.bind(e) != None)
+    return rv
+
+  def search(patterns):
+    return sum(corpus.count(pattern) for pattern in patterns)
+
+  _time('compiled match loop', loop, patterns[:1])
+  _time('loop, %d patterns' % (queries,), loop, patterns)
+
+  # the first search builds the index, cold: the metadata of the expressions
+  # is cached on the nodes, so a second corpus over them would be cheaper
+  corpus = Corpus(exps)
+  _time('search, %d patterns' % (queries,), search, patterns)
+  _time('search again', search, patterns[:1])
+
+  c, b, a = symath.wilds('c b a')
+  _time('search everything, pool', lambda: sum(1 for m in corpus.search(c * b + a, processes=processes)))
+
+if __name__ == '__main__':
+  main(*map(int, sys.argv[1:]))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+'''
+measures how the cost of dict and set lookups keyed on expressions scales
+with the number of expressions
+
+every expression built here is a distinct '+' node, which is the worst case
+for a hash that only looks at the head of the expression.  the "name" column
+emulates that by wrapping each key in an object hashed on exp.name
+'''
+
+import sys
+import timeit
+import symath
+
+class _NameHashed(object):
+  __slots__ = ('exp',)
+
+  def __init__(self, exp):
+    self.exp = exp
+
+  def __hash__(self):
+    return hash(self.exp.name)
+
+  def __eq__(self, other):
+    return self.exp is other.exp
+
+def _expressions(count):
+  x = symath.symbols('x')
+  return [x + i for i in range(count)]
+
+def _time_lookups(keys, repeat=3):
+  d = dict((k, None) for k in keys)
+  s = set(keys)
+
+  def _():
+    for k in keys:
+      k in d
+      k in s
+
+  return min(timeit.repeat(_, number=1, repeat=repeat)) / (2 * len(keys))
+
+def main(sizes):
+  print '%10s %18s %18s' % ('count', 'structural (us)', 'name (us)')
+  for count in sizes:
+    exps = _expressions(count)
+    structural = _time_lookups(exps)
+
+    # the name hash is quadratic, don't let it run forever
+    if count <= 5000:
+      name = '%18.3f' % (_time_lookups([_NameHashed(e) for e in exps], repeat=1) * 1e6,)
+    else:
+      name = '%18s' % ('skipped',)
+
+    print '%10d %18.3f %s' % (count, structural * 1e6, name)
+
+if __name__ == '__main__':
+  sizes = map(int, sys.argv[1:]) or [1000, 5000, 20000, 100000]
+  main(sizes)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+'''
+measures how long import symath takes in a fresh interpreter
+
+"lazy" is a plain import symath, "eager" also imports everything the package
+used to load up front (simplify, match, the solvers with z3, calculus,
+functions and numpy).  each figure is the best of several fresh processes
+'''
+
+import subprocess
+import sys
+
+_STATEMENTS = {
+    'lazy': 'import symath',
+    'eager': 'import symath, symath.simplify, symath.match, symath.solvers, '
+        'symath.calculus, symath.functions, numpy'
+    }
+
+_HEAVY = ('numpy', 'scipy', 'z3', 'symath.simplify', 'symath.match',
+    'symath.solvers', 'symath.calculus', 'symath.functions')
+
+_SCRIPT = '''
+import sys, time
+start = time.time()
+%s
+elapsed = time.time() - start
+print elapsed, len(sys.modules), ','.join(m for m in %r if m in sys.modules)
+'''
+
+def _measure(statement):
+  out = subprocess.check_output([sys.executable, '-c', _SCRIPT % (statement, _HEAVY)])
+  elapsed, modules, heavy = (out.strip().split(' ') + [''])[:3]
+  return float(elapsed), int(modules), heavy
+
+def main(repeat=5):
+  print '%6s %10s %8s  %s' % ('', 'ms', 'modules', 'heavy modules loaded')
+  for name in ('lazy', 'eager'):
+    runs = [_measure(_STATEMENTS[name]) for i in range(repeat)]
+    elapsed, modules, heavy = min(runs)
+    print '%6s %10.1f %8d  %s' % (name, elapsed * 1000, modules, heavy or '-')
+
+if __name__ == '__main__':
+  main(*map(int, sys.argv[1:]))
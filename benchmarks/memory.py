@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+'''
+reports the memory used per expression node
+
+"slots" is the current layout of symath.core.Fn, "legacy" rebuilds the old
+layout (an empty tuple subclass carrying a __dict__ with name, kargs, fn and
+args, interned through a strong Memoize table) so the two can be compared.
+the per-node figure counts the node itself, its argument tuple and anything
+hanging off the node that is not shared with other nodes.  the resident size
+is measured by building count nodes of each layout in a fresh process, and
+includes the intern table entry for each node
+'''
+
+import gc
+import resource
+import subprocess
+import sys
+import symath
+from symath.memoize import Memoize
+
+class _Legacy(tuple):
+  def __new__(typ, fn, *args):
+    self = tuple.__new__(typ)
+    self.kargs = fn.kargs
+    self.name = fn.name
+    self.fn = fn
+    self.args = args
+    return self
+
+_legacy = Memoize(lambda typ, fn, *args: _Legacy(fn, *args))
+
+def _per_node(node):
+  rv = sys.getsizeof(node) + sys.getsizeof(node.args)
+  if hasattr(node, '__dict__'):
+    rv += sys.getsizeof(node.__dict__)
+  if hasattr(node, '_hash'):
+    rv += sys.getsizeof(node._hash)
+  return rv
+
+def _build(layout, count):
+  x = symath.symbols('x')
+  add = symath.stdops.Add
+  nums = [symath.symbolic(i) for i in range(count)]
+  gc.collect()
+  before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  if layout == 'slots':
+    nodes = [add(x, n) for n in nums]
+  else:
+    nodes = [_legacy(_Legacy, add, x, n) for n in nums]
+
+  gc.collect()
+  after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return nodes, (after - before) * 1024.0 / count
+
+def _resident(layout, count):
+  out = subprocess.check_output([sys.executable, __file__, '--resident', layout, str(count)])
+  return float(out)
+
+def main(count):
+  x = symath.symbols('x')
+  node = x + 1
+  legacy = _Legacy(symath.stdops.Add, x, symath.symbolic(1))
+
+  print '%8s %16s %22s' % ('layout', 'bytes/node', 'resident bytes/node')
+  for layout, n in (('legacy', legacy), ('slots', node)):
+    print '%8s %16d %22.1f' % (layout, _per_node(n), _resident(layout, count))
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1 and sys.argv[1] == '--resident':
+    print _build(sys.argv[2], int(sys.argv[3]))[1]
+  else:
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
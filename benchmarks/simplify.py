@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+'''
+compares simplify (the single pass normalizer) against simplify as it was in
+the baseline commit, the rules run pass after pass over the whole expression
+
+the baseline runs in a child process on a copy of the symath package of that
+commit, taken with git archive, by default the root commit of the
+repository.  the same expressions are built on both sides from the same seed
+
+"cold" clears the caches of simplify before every expression, "warm" runs
+over all the expressions with the caches kept, as when overlapping
+expressions are simplified one after the other (the baseline has no caches,
+both rows are the same work there).  "expand" simplifies products of sums of
+growing length, the baseline only gets 2 factors, it takes half a minute on 3
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import symath
+import symath.simplify as simplify
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _expression(rng, depth):
+  x, y, z = symath.symbols('x y z')
+  leaves = [x, y, z, 1, 2, 3]
+  if depth == 0 or rng.random() < 0.3:
+    return symath.symbolic(rng.choice(leaves))
+  a, b = _expression(rng, depth - 1), _expression(rng, depth - 1)
+  return rng.choice([a + b, a * b, a - b, a & b, a | b, a / (b + 7)])
+
+def _product(n):
+  x = symath.symbols('x0 x1 x2 x3 x4 x5 x6')
+  return reduce(lambda a, b: a * b, [x[i] + x[i + 1] + i for i in range(n)])
+
+def _clear():
+  # the baseline has no caches
+  if hasattr(simplify, 'clear_cache'):
+    simplify.clear_cache()
+
+def _run(fn, exps, cold):
+  start = time.time()
+  for e in exps:
+    if cold:
+      _clear()
+    fn(e)
+  return time.time() - start
+
+def _times(count, depth, factors):
+  '''
+  returns (row, seconds) for the symath that is imported, normalize or the
+  baseline simplify
+  '''
+  fn = getattr(simplify, 'normalize', simplify.simplify)
+  rng = random.Random(0)
+  exps = [_expression(rng, depth) for i in range(count)]
+  rv = []
+  for cold in (True, False):
+    _clear()
+    rv.append(('cold' if cold else 'warm', _run(fn, exps, cold)))
+  for n in factors:
+    rv.append(('expand %d' % (n,), _run(fn, [_product(n)], True)))
+  return rv
+
+def _baseline_times(rev, count, depth, factors):
+  tmp = tempfile.mkdtemp()
+  try:
+    archive = subprocess.Popen(['git', 'archive', rev, 'symath'], cwd=_ROOT, stdout=subprocess.PIPE)
+    subprocess.check_call(['tar', '-x', '-C', tmp], stdin=archive.stdout)
+    if archive.wait() != 0:
+      raise RuntimeError("git archive %s failed" % (rev,))
+
+    env = dict(os.environ, PYTHONPATH=tmp)
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--times',
+        str(count), str(depth), ','.join(map(str, factors))], env=env, cwd=tmp)
+  finally:
+    shutil.rmtree(tmp)
+
+  rv = {}
+  for line in out.splitlines():
+    name, seconds = line.split('\t')
+    rv[name] = float(seconds)
+  return rv
+
+def main(count=200, depth=4, rev=None):
+  if rev == None:
+    rev = subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=_ROOT).split()[0]
+
+  baseline = _baseline_times(rev, count, depth, (2,))
+  print '%-10s %12s %12s' % ('', 'baseline', 'normalize')
+  for name, t in _times(count, depth, (2, 3, 4, 5)):
+    t0 = '%11.3fs' % (baseline[name],) if name in baseline else '-'
+    print '%-10s %12s %11.3fs' % (name, t0, t)
+
+if __name__ == '__main__':
+  if sys.argv[1:2] == ['--times']:
+    count, depth, factors = sys.argv[2:5]
+    for name, t in _times(int(count), int(depth), map(int, factors.split(','))):
+      print '%s\t%r' % (name, t)
+  else:
+    main(*map(int, sys.argv[1:3]) + sys.argv[3:4])
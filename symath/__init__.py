@@ -1,8 +1,10 @@
-import simplify
 from core import Boolean,Number,Symbol,Wild,symbols,wilds,symbolic,wild,WildResults,desymbolic,collect,replace
 from simplestruct import SimpleStruct
 
-import match
-import solvers
-import calculus
-import functions
+# loaded on first use, importing the real module replaces these
+from lazy import LazyModule
+simplify = LazyModule('symath.simplify')
+match = LazyModule('symath.match')
+solvers = LazyModule('symath.solvers')
+calculus = LazyModule('symath.calculus')
+functions = LazyModule('symath.functions')
@@ -7,7 +7,10 @@ rules
 '''
 
 import symath
+import symath.core
+import symath.memoize
 import symath.util as util
+import symath.substitution
 import numpy
 
 def _combine_subs(subs, vals):
@@ -24,15 +27,8 @@ def _combine_subs(subs, vals):
 
   return rv
 
-@symath.memoize.Memoize
 def _recursive_len(exp):
-  if isinstance(exp, symath.core.Fn):
-    rv = 1
-    for i in exp.args:
-      rv += _recursive_len(i)
-    return rv
-  else:
-    return len(exp)
+  return exp.size
 
 def _tuple_edit_distance(t1, t2, k, **subs):
   
@@ -109,7 +105,7 @@ def _tuple_edit_distance(t1, t2, k, **subs):
     util.debug('skipped %d out of %d calculations' % (len(filter(lambda x: x == -1, M.flatten())), ((len(t1) + 1) * (len(t2) + 1)) - len(t1) - len(t2) - 1))
   return rv
 
-@symath.memoize.Memoize
+@symath.memoize.Memoize.Bounded(maxsize=65536)
 def _edit_distance(exp1, exp2, k, **subs):
   assert isinstance(k, int)
   vals = symath.core.WildResults()
@@ -118,8 +114,7 @@ def _edit_distance(exp1, exp2, k, **subs):
   for key in subs:
     csubs[symath.core.wild(key)] = subs[key]
 
-  exp1 = exp1.substitute(csubs)
-  exp2 = exp2.substitute(csubs)
+  exp1, exp2 = symath.substitution.substitute_many((exp1, exp2), csubs)
 
   if exp1.match(exp2, vals) or exp2.match(exp1, vals):
     return 0, _combine_subs(subs, vals)
@@ -142,7 +137,7 @@ def _edit_distance(exp1, exp2, k, **subs):
   else:
     return 1, subs
 
-@symath.memoize.Memoize
+@symath.memoize.Memoize.Bounded(maxsize=4096)
 def _prepare_exps(exp1, exp2):
   '''
   replace wilds with their equivelant symbols in exp2
@@ -1,74 +1,107 @@
-from core import WildResults, wilds, symbolic, symbols
+from core import WildResults, wilds, symbolic, symbols, Symbol, Fn
 from functions import *
 from stdops import *
 from memoize import Memoize
+import match
+import traversal
 
 _known_functions = (Log, Add, Sub, Mul, Div, Pow, Sin, Cos, Tan, Exp, Sum)
 
+_f, _g, _h, _v = wilds('f g h v')
+# simplify flattens sums and products, g takes one operand and h the rest
+_add = match.compile(_g + _h, ac=True)
+_sub = match.compile(_g - _h)
+_pow = match.compile(_v ** _g, 'v g')
+_mul = match.compile(_g * _h, ac=True)
+_div = match.compile(_g / _h)
+_exp = match.compile(Exp(_v))
+_sin = match.compile(Sin(_v))
+_cos = match.compile(Cos(_v))
+_sum = match.compile(Sum(_g, _h))
+_log = match.compile(Log(_v))
+_unary = match.compile(_f(_g), 'f g')
+
 class DifferentiationError(Exception):
   pass
 
-def _diff_known_function(expression, variable):
+def _depends_on(expression, variable):
+  if isinstance(variable, Symbol):
+    return variable in expression.free_symbols
+  return traversal.any(expression, lambda e: e == variable)
 
-  vals = WildResults()
-  g,h = wilds('g h')
+def _of_variable(pattern, expression, variable):
+  m = pattern.bind(expression)
+  return m != None and m[0] is variable
+
+def _diff_known_function(expression, variable):
 
   if expression[0] not in _known_functions:
     raise DifferentiationError("d/d%s  %s" % (variable,expression))
 
-  if expression.match(g + h, vals):
-    return diff(vals.g, variable) + diff(vals.h, variable)
+  m = _add.bind(expression)
+  if m != None:
+    g, h = m
+    return diff(g, variable) + diff(h, variable)
 
-  elif expression.match(g - h, vals):
-    return diff(vals.g, variable) - diff(vals.h, variable)
+  m = _sub.bind(expression)
+  if m != None:
+    g, h = m
+    return diff(g, variable) - diff(h, variable)
 
-  elif expression.match(variable ** g, vals):
-    return vals.g * (variable ** (vals.g - 1))
+  m = _pow.bind(expression)
+  if m != None and m[0] is variable:
+    g = m[1]
+    return g * (variable ** (g - 1))
 
-  elif expression.match(g * h, vals):
-    return vals.g * diff(vals.h, variable) + vals.h * diff(vals.g, variable)
+  m = _mul.bind(expression)
+  if m != None:
+    g, h = m
+    return g * diff(h, variable) + h * diff(g, variable)
 
-  elif expression.match(g / h, vals):
-    return (diff(vals.g, variable) * vals.h - vals.g * diff(vals.h, variable)) / (vals.h ** 2)
+  m = _div.bind(expression)
+  if m != None:
+    g, h = m
+    return (diff(g, variable) * h - g * diff(h, variable)) / (h ** 2)
 
-  elif expression.match(Exp(variable)):
+  if _of_variable(_exp, expression, variable):
     return expression
 
-  elif expression.match(Sin(variable)):
+  elif _of_variable(_sin, expression, variable):
     return Sin(variable)
 
-  elif expression.match(Cos(variable)):
+  elif _of_variable(_cos, expression, variable):
     return -1 * Sin(variable)
 
-  elif expression.match(Sum(g, h), vals):
-    if(variable(vals.g) in vals.h):
-      return Sum(vals.g, diff(vals.h, variable(vals.g)))
+  m = _sum.bind(expression)
+  if m != None:
+    g, h = m
+    if _depends_on(h, variable(g)):
+      return Sum(g, diff(h, variable(g)))
     else:
-      return Sum(vals.g, diff(vals.h, variable))
+      return Sum(g, diff(h, variable))
 
-  elif expression.match(Log(variable), vals):
+  if _of_variable(_log, expression, variable):
     return 1.0 / variable
 
   raise DifferentiationError("d/d%s  %s" % (variable,expression))
 
 def diff(expression, variable):
 
-  vals = WildResults()
-  f,a,b = wilds('f a b')
-
   expression = expression.simplify()
 
-  if variable not in expression:
+  if not _depends_on(expression, variable):
     return symbolic(0)
 
   elif expression.match(variable):
     return symbolic(1)
 
-  elif expression.match(f(a,b), vals) and vals.f in _known_functions:
+  if isinstance(expression, Fn) and len(expression.args) >= 2 and expression.fn in _known_functions:
     return _diff_known_function(expression, variable)
 
-  elif expression.match(f(a), vals) and vals.f in _known_functions:
-    return _diff_known_function(vals.f(vals.a), vals.a) * diff(vals.a, variable)
+  m = _unary.bind(expression)
+  if m != None and m[0] in _known_functions:
+    f, a = m
+    return _diff_known_function(f(a), a) * diff(a, variable)
 
   raise DifferentiationError("d/d%s  %s" % (variable,expression))
 
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+'''
+generates native python functions from expressions
+
+the expression is simplified once and put in let-bound form by cse, then
+every binding becomes one assignment in the body of the generated function.
+operators are mapped through the numeric and cast keyword arguments of their
+head (see stdops)
+
+there are two backends, _Scalar evaluates one point with python numbers and
+_Vectorized evaluates a whole batch with numpy array operations
+'''
+
+import operator
+import core
+import cse
+from memoize import Memoize
+
+class CodegenError(Exception):
+  pass
+
+def _numeric_op(node):
+  '''
+  returns (numeric name, cast) for an operator application we know how to
+  evaluate
+  '''
+  head = node.fn
+  if not isinstance(head, core.Symbol) or 'numeric' not in head.kargs or len(node.args) < 2:
+    raise CodegenError("no numeric operation for %s" % (node,))
+  elif len(node.args) > 2 and not head.kargs.get('associative', False):
+    raise CodegenError("no numeric operation for %s" % (node,))
+
+  cast = head.kargs['cast'] if 'cast' in head.kargs else None
+  return head.kargs['numeric'], cast
+
+def _call(fn, operands):
+  '''
+  returns the python expression calling the binary fn on operands,
+  applications of associative operators to more than two operands are folded
+  from the left
+  '''
+  rv = operands[0]
+  for o in operands[1:]:
+    rv = '%s(%s, %s)' % (fn, rv, o)
+  return rv
+
+class _Scalar(object):
+
+  def param(self, p, name):
+    return '%s = %s if %s.__class__ is bool else float(%s)' % (p, p, p, p)
+
+  def apply(self, node, operands, name):
+    '''
+    returns the python expression for node applied to operands
+    name(value) returns the name of a global holding value
+    '''
+    numeric, cast = _numeric_op(node)
+    if cast != None:
+      operands = ['%s(%s)' % (name(cast), o) for o in operands]
+
+    rv = _call(name(getattr(operator, numeric)), operands)
+
+    # the interpreter turns integer results back into floating point Numbers
+    if cast not in (None, bool):
+      rv = 'float(%s)' % (rv,)
+
+    return rv
+
+  def result(self, rv, params, name):
+    return rv
+
+class _Vectorized(object):
+
+  def __init__(self):
+    import numpy
+    import functions
+
+    self.numpy = numpy
+    self.ufuncs = {
+        '__add__': numpy.add,
+        '__sub__': numpy.subtract,
+        '__mul__': numpy.multiply,
+        '__div__': numpy.true_divide,
+        '__pow__': numpy.power,
+        '__rshift__': numpy.right_shift,
+        '__lshift__': numpy.left_shift,
+        '__and__': numpy.bitwise_and,
+        '__or__': numpy.bitwise_or,
+        '__xor__': numpy.bitwise_xor
+        }
+    self.logical = {
+        '__and__': numpy.logical_and,
+        '__or__': numpy.logical_or,
+        '__xor__': numpy.logical_xor
+        }
+    self.functions = {
+        functions.Sin: numpy.sin,
+        functions.Cos: numpy.cos,
+        functions.Tan: numpy.tan,
+        functions.ArcSin: numpy.arcsin,
+        functions.ArcCos: numpy.arccos,
+        functions.ArcTan: numpy.arctan,
+        functions.Exp: numpy.exp,
+        functions.Log: numpy.log
+        }
+
+  def param(self, p, name):
+    return '%s = %s(%s)' % (p, name(self.asarray), p)
+
+  def asarray(self, a):
+    a = self.numpy.asarray(a)
+    return a if a.dtype == bool else a.astype(float)
+
+  def apply(self, node, operands, name):
+    if node.fn in self.functions and len(operands) == 1:
+      return '%s(%s)' % (name(self.functions[node.fn]), operands[0])
+
+    numeric, cast = _numeric_op(node)
+    if cast == bool:
+      return _call(name(self.logical[numeric]), operands)
+
+    if cast != None:
+      dtype = name(self.numpy.int64)
+      operands = ['%s(%s).astype(%s)' % (name(self.numpy.asarray), o, dtype) for o in operands]
+
+    rv = _call(name(self.ufuncs[numeric]), operands)
+    if cast != None:
+      rv = '%s.astype(float)' % (rv,)
+
+    return rv
+
+  def result(self, rv, params, name):
+    # one result per element of the batch, even where the expression doesn't
+    # depend on all the arguments, or on none of them
+    return '%s(%s)' % (name(self.broadcast), ', '.join([rv] + params))
+
+  def broadcast(self, rv, *params):
+    rv = self.asarray(rv)
+    if len(params) == 0:
+      return rv
+    return self.numpy.broadcast_arrays(rv, *params)[0].copy()
+
+def _source(exp, arguments, backend):
+  '''
+  returns (source, globals) for a function named compiled evaluating exp
+  '''
+  env = {}
+  envnames = {}
+  params = ['a%d' % (i,) for i in range(len(arguments))]
+
+  def _global(value):
+    if id(value) not in envnames:
+      envnames[id(value)] = '_g%d' % (len(env),)
+      env[envnames[id(value)]] = value
+    return envnames[id(value)]
+
+  # arguments that are not leaves would be split up by cse, stand them in
+  # with symbols first
+  compound = [a for a in arguments if isinstance(a, core.Fn)]
+  if len(compound) > 0:
+    fresh = cse._fresh_symbols(exp)
+    subs = dict((a, next(fresh)) for a in compound)
+    exp = exp.substitute(subs)
+    arguments = [subs[a] if a in subs else a for a in arguments]
+
+  names = dict(zip(arguments, params))
+
+  def _operand(node):
+    if node in names:
+      return names[node]
+    elif isinstance(node, core._KnownValue):
+      return _global(node.value())
+    else:
+      raise CodegenError("%s is not an argument" % (node,))
+
+  def _apply(node):
+    return backend.apply(node, [_operand(a) for a in node.args], _global)
+
+  bindings, root = cse.cse(exp, 1)
+
+  body = [backend.param(p, _global) for p in params]
+  for sym, node in bindings:
+    names[sym] = 't%d' % (len(body) - len(params),)
+    body.append('%s = %s' % (names[sym], _apply(node)))
+
+  rv = _apply(root) if isinstance(root, core.Fn) else _operand(root)
+  body.append('return %s' % (backend.result(rv, params, _global),))
+
+  src = 'def compiled(%s):\n  %s\n' % (', '.join(params), '\n  '.join(body))
+  return src, env
+
+def _interpreted(exp, arguments):
+  '''
+  the slow path, substitutes and simplifies on every call
+  '''
+  def _compiled_func(*args):
+    assert len(args) == len(arguments)
+    argdic = {}
+    for i in range(len(args)):
+      argdic[arguments[i]] = args[i]
+    rv = exp.substitute(argdic).simplify()
+    return core.desymbolic(rv)
+
+  return _compiled_func
+
+@Memoize.Bounded(maxsize=1024)
+def _compile(exp, arguments, vectorized):
+  backend = _Vectorized() if vectorized else _Scalar()
+  try:
+    src, env = _source(exp.simplify(), arguments, backend)
+  except CodegenError:
+    if vectorized:
+      return backend.numpy.vectorize(_compile(exp, arguments, False), otypes=[float])
+    return _interpreted(exp, arguments)
+
+  exec src in env
+  return env['compiled']
+
+def to_function(exp, *arguments):
+  '''
+  returns a python function of arguments evaluating exp
+
+  falls back to substituting and simplifying on every call if the expression
+  contains anything we can't generate code for
+  '''
+  return _compile(exp, arguments, False)
+
+def to_vectorized_function(exp, *arguments):
+  '''
+  returns a function of arguments evaluating exp over numpy arrays (or
+  anything numpy.asarray accepts), the arguments are broadcast against each
+  other and the whole batch is evaluated with array operations
+
+  falls back to numpy.vectorize over the scalar version if the expression
+  contains anything we can't generate code for
+  '''
+  return _compile(exp, arguments, True)
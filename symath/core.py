@@ -8,44 +8,263 @@ import copy
 import operator
 import random
 import string
-from memoize import Memoize
-import numpy
-import util
+import sys
+import hashlib
+from hashcons import InternTable
+import traversal
 
 def collect(exp, fn):
-  rv = set()
-  
-  def _collect(exp):
-    if fn(exp):
-      rv.add(exp)
-    return exp
+  return traversal.collect(exp, fn)
 
-  exp.walk(_collect)
-  return rv
+def replace(expr, d, repeat=True):
+  '''
+  rewrites expr with the rules in d (pattern => replacement), until none of
+  them matches anymore unless repeat is False, see rewrite.replace
+  '''
+  import rewrite
+  return rewrite.replace(expr, d, repeat)
 
-def _replace_one(expr, match, repl):
-  vals = WildResults()
-  if expr.match(match, vals):
-    expr = repl.substitute({wilds(w): vals[w] for w in vals})
 
-  if len(expr) > 1:
-    return expr[0](*[_replace_one(x, match, repl) for x in expr.args])
-  else:
-    return expr
+class _Metadata(object):
+  '''
+  structural properties of an expression, computed once per node
+  '''
+  __slots__ = ('size', 'depth', 'has_wilds', 'head', 'free_symbols', 'fingerprint', 'sort_key')
 
-def replace(expr, d, repeat=True):
-  while True:
-    old_expr = expr
-    for k in d:
-      expr = _replace_one(expr, k, d[k])
+_no_symbols = frozenset()
+
+def _metadata(exp):
+  '''
+  computes the metadata of exp, and of every subterm that doesn't have it
+  yet, bottom up and caches it on the nodes
+  '''
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    if hasattr(node, '_meta'):
+      stack.pop()
+      continue
+
+    children = [node.fn] + list(node.args) if isinstance(node, Fn) else []
+    pending = [c for c in children if not hasattr(c, '_meta')]
+    if len(pending) > 0:
+      stack.extend(pending)
+      continue
+
+    stack.pop()
+    m = _Metadata()
+    if len(children) == 0:
+      m.size = 1
+      m.depth = 1
+      m.has_wilds = isinstance(node, Wild)
+      m.head = node
+    else:
+      metas = [c._meta for c in children]
+      m.size = 1 + sum(a.size for a in metas[1:])
+      m.depth = 1 + max([a.depth for a in metas[1:]] + [0])
+      m.has_wilds = any(a.has_wilds for a in metas)
+      m.head = metas[0].head
+
+    node._meta = m
+
+  return exp._meta
+
+def _kargs_text(kargs):
+  return repr(sorted(kargs.items())) if len(kargs) > 0 else ''
+
+def _fingerprint(exp):
+  '''
+  computes the fingerprint of exp, and of every subterm that doesn't have it
+  yet, bottom up and caches it in their metadata
+
+  unlike the hash, the fingerprint only depends on the structure, so it is
+  the same in every process
+  '''
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    m = node.metadata
+    if getattr(m, 'fingerprint', None) != None:
+      stack.pop()
+      continue
+
+    if isinstance(node, Fn):
+      children = [node.fn] + list(node.args)
+      pending = [c for c in children if getattr(c.metadata, 'fingerprint', None) == None]
+      if len(pending) > 0:
+        stack.extend(pending)
+        continue
+      text = 'f' + ''.join(c._meta.fingerprint for c in children)
+    elif isinstance(node, Number):
+      text = 'n' + repr(node.n)
+    elif isinstance(node, Boolean):
+      text = 'b' + str(bool(node.boolean))
+    elif isinstance(node, Wild):
+      text = 'w%s:%s' % (node.name, _kargs_text(node.kargs))
+    else:
+      text = 's%s:%s' % (node.name, _kargs_text(node.kargs))
+
+    stack.pop()
+    m.fingerprint = hashlib.sha1(text).hexdigest()
+
+  return exp._meta.fingerprint
+
+def _free_symbols(exp):
+  '''
+  computes the free symbols of exp, and of every subterm that doesn't have
+  them yet, bottom up and caches them in their metadata
+
+  only done when asked for, not with the rest of the metadata.  a node
+  shares the set of its child with the most symbols when the others add
+  none to it
+  '''
+  # every subterm has its metadata once exp has
+  exp.metadata
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    m = node._meta
+    if getattr(m, 'free_symbols', None) is not None:
+      stack.pop()
+      continue
+
+    if isinstance(node, Fn):
+      children = (node.fn,) + tuple(node.args)
+      pending = [c for c in children if getattr(c._meta, 'free_symbols', None) is None]
+      if len(pending) > 0:
+        stack.extend(pending)
+        continue
+      fs = _no_symbols
+      for c in children:
+        a = c._meta.free_symbols
+        if len(a) > len(fs):
+          a, fs = fs, a
+        if not a <= fs:
+          fs = fs | a
+    elif isinstance(node, Symbol):
+      fs = frozenset([node])
+    else:
+      fs = _no_symbols
+
+    stack.pop()
+    m.free_symbols = fs
+
+  return exp._meta.free_symbols
+
+def _compare_keys(a, b):
+  # compares two sort keys like tuples would, but from an explicit stack: the
+  # keys of deep expressions are deeply nested and comparing them in C would
+  # recurse once per level.  shared subkeys are skipped without looking in
+  stack = [(a, b)]
+  while len(stack) > 0:
+    a, b = stack.pop()
+    if a is b:
+      continue
+    elif a.__class__ is int:
+      # the lengths of two argument lists whose common part is equal
+      if a != b:
+        return -1 if a < b else 1
+      continue
+    elif a[0] != b[0]:
+      return -1 if a[0] < b[0] else 1
+    elif a[0] != 3:
+      if a[1] != b[1]:
+        return -1 if a[1] < b[1] else 1
+      continue
+
+    # applications, by head and then by arguments
+    args, other = a[2], b[2]
+    stack.append((len(args), len(other)))
+    for i in range(min(len(args), len(other)) - 1, -1, -1):
+      stack.append((args[i], other[i]))
+    stack.append((a[1], b[1]))
+
+  return 0
+
+class _SortKey(tuple):
+  '''
+  the canonical sort key of a node, a tuple whose comparisons don't recurse,
+  see _sort_key
+  '''
+  __slots__ = ()
+
+  def __cmp__(self, other):
+    return _compare_keys(self, other)
+
+  def __eq__(self, other):
+    if not isinstance(other, _SortKey):
+      return NotImplemented
+    return _compare_keys(self, other) == 0
+
+  def __ne__(self, other):
+    if not isinstance(other, _SortKey):
+      return NotImplemented
+    return _compare_keys(self, other) != 0
+
+  def __lt__(self, other):
+    return _compare_keys(self, other) < 0
+
+  def __le__(self, other):
+    return _compare_keys(self, other) <= 0
 
-    if old_expr == expr or not repeat:
-      return expr
+  def __gt__(self, other):
+    return _compare_keys(self, other) > 0
+
+  def __ge__(self, other):
+    return _compare_keys(self, other) >= 0
+
+  def __hash__(self):
+    # shallow, hashing the nested tuples would recurse too
+    if self[0] == 3:
+      return hash((3, len(self[2])))
+    return tuple.__hash__(self)
+
+def _sort_key(exp):
+  '''
+  computes the sort key of exp, and of every subterm that doesn't have it
+  yet, bottom up and caches it in their metadata
+
+  numbers come first by value, then symbols by name, then the other leaves,
+  then function applications by head and then arguments.  the key of an
+  application is built from the keys of its children, which it shares, so
+  keys are small and comparing two of them stops where the expressions
+  differ: subterms that are the same node have the same key object.  keys
+  are compared without recursion, see _SortKey
+  '''
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    m = node.metadata
+    if getattr(m, 'sort_key', None) is not None:
+      stack.pop()
+      continue
+
+    if isinstance(node, Fn):
+      children = [node.fn] + list(node.args)
+      pending = [c for c in children if getattr(c.metadata, 'sort_key', None) is None]
+      if len(pending) > 0:
+        stack.extend(pending)
+        continue
+      key = _SortKey((3, node.fn._meta.sort_key, tuple(a._meta.sort_key for a in node.args)))
+    elif isinstance(node, Number):
+      key = _SortKey((0, node.n))
+    elif isinstance(node, Symbol):
+      key = _SortKey((1, node.name))
+    else:
+      key = _SortKey((2, str(node)))
 
+    stack.pop()
+    m.sort_key = key
 
-class _Symbolic(tuple):
+  return exp._meta.sort_key
 
-  def match(self, other, valuestore=None):
+class _Symbolic(object):
+  # nodes are interned and immutable, so keep them small: no per-instance
+  # __dict__, just the weakref needed by the intern tables, the cached hash
+  # and the lazily computed metadata
+  __slots__ = ('__weakref__', '_hash', '_meta')
+
+  def match(self, other, valuestore=None, ac=False):
     '''
     matches against a pattern, use wilds() to generate wilds
   
@@ -58,16 +277,21 @@ class _Symbolic(tuple):
         print val.b
     '''
     import match
-    return match.match(self, other, valuestore)
+    return match.match(self, other, valuestore, ac)
 
   def __hash__(self):
-    return hash(self.name)
+    # structural hash, computed once by the constructor
+    return self._hash
 
   def simplify(self):
     import simplify
     return simplify.simplify(self)
 
   def walk(self, *fns):
+    '''
+    rebuilds the expression bottom up, passing every node through fns
+    see traversal.walk
+    '''
     if len(fns) > 1:
       def _(exp):
         for f in fns:
@@ -75,30 +299,59 @@ class _Symbolic(tuple):
         return exp
       return self.walk(_)
 
-    exp = self
-    fn = fns[0]
-    if len(exp) == 1:
-      oldexp = exp
-      exp = fn(exp)
-      while exp != oldexp:
-        oldexp = exp
-        exp = fn(exp)
+    return traversal.walk(self, fns[0])
 
-    else:
-      args = list(map(lambda x: x.walk(fn), exp.args))
-      oldexp = self
-      exp = fn(fn(exp[0])(*args))
+  @property
+  def metadata(self):
+    try:
+      return self._meta
+    except AttributeError:
+      return _metadata(self)
+
+  @property
+  def size(self):
+    '''number of nodes, a function application counts once for its head'''
+    return self.metadata.size
+
+  @property
+  def depth(self):
+    return self.metadata.depth
+
+  @property
+  def free_symbols(self):
+    '''
+    frozenset of the symbols appearing anywhere in the expression, heads
+    included.  computed on first use and kept on the nodes, see _free_symbols
+    '''
+    try:
+      return self._meta.free_symbols
+    except AttributeError:
+      return _free_symbols(self)
+
+  @property
+  def has_wilds(self):
+    return self.metadata.has_wilds
+
+  @property
+  def head(self):
+    '''the leaf in head position, the expression itself for leaves'''
+    return self.metadata.head
 
-      #while exp != oldexp:
-      #  print '%s => %s' % (oldexp, exp)
-      #  oldexp = exp
-      #  exp = exp.walk(fn)
+  @property
+  def fingerprint(self):
+    '''hex digest of the structure of the expression, stable across processes'''
+    try:
+      return self._meta.fingerprint
+    except AttributeError:
+      return _fingerprint(self)
 
-    if util.DEBUG and exp != self:
-      #print '%s => %s (%s)' % (self, exp, fn)
-      pass
-     
-    return exp
+  @property
+  def sort_key(self):
+    '''the canonical order of expressions, see _sort_key'''
+    try:
+      return self._meta.sort_key
+    except AttributeError:
+      return _sort_key(self)
 
   def _dump(self):
     return {
@@ -107,39 +360,28 @@ class _Symbolic(tuple):
         }
 
   def __contains__(self, exp):
-    rv = {}
-    rv['val'] = False
-
-    def _(_exp):
-      if _exp.match(exp):
-        rv['val'] = True
-      return _exp
-    self.walk(_)
-
-    return rv['val']
+    return traversal.any(self, lambda _exp: _exp.match(exp))
 
   def substitute(self, subs):
     '''
     takes a dictionary of substitutions
     returns itself with substitutions made
     '''
-    if self in subs:
-      self = subs[self]
-
-    return self
+    import substitution
+    return substitution.substitute(self, subs)
 
   def compile(self, *arguments):
     '''compiles a symbolic expression with arguments to a python function'''
+    import codegen
+    return codegen.to_function(self, *arguments)
 
-    def _compiled_func(*args):
-      assert len(args) == len(arguments)
-      argdic = {}
-      for i in range(len(args)):
-        argdic[arguments[i]] = args[i]
-      rv = self.substitute(argdic).simplify()
-      return desymbolic(rv)
-
-    return _compiled_func
+  def compile_vectorized(self, *arguments):
+    '''
+    compiles a symbolic expression with arguments to a python function
+    which takes numpy arrays and evaluates the expression over all of them
+    '''
+    import codegen
+    return codegen.to_vectorized_function(self, *arguments)
 
   def __eq__(self, other):
     #return type(self) == type(other) and self.name == other.name
@@ -235,18 +477,28 @@ class _Symbolic(tuple):
     return self * -1
 
 class _KnownValue(_Symbolic):
+  __slots__ = ()
+
   def value(self):
     raise BaseException('not implemented')
 
 class Boolean(_KnownValue):
+  __slots__ = ('boolean',)
 
-  @Memoize
+  @InternTable
   def __new__(typ, b):
     self = _KnownValue.__new__(typ)
-    self.name = str(b)
     self.boolean = b
+    self._hash = hash(('Boolean', bool(b)))
     return self
 
+  @property
+  def name(self):
+    return str(self.boolean)
+
+  def __reduce__(self):
+    return (Boolean, (self.boolean,))
+
   def value(self):
     return bool(self.boolean)
 
@@ -265,18 +517,26 @@ class Boolean(_KnownValue):
       return bool(self.boolean) == other
 
 class Number(_KnownValue):
+  __slots__ = ('n',)
 
   IFORMAT = str
   FFORMAT = str
 
-  @Memoize
+  @InternTable
   def __new__(typ, n):
     n = float(n)
     self = _KnownValue.__new__(typ)
-    self.name = str(n)
     self.n = n
+    self._hash = hash(('Number', n))
     return self
 
+  @property
+  def name(self):
+    return str(self.n)
+
+  def __reduce__(self):
+    return (Number, (self.n,))
+
   @property
   def is_integer(self):
     return self.n.is_integer()
@@ -344,14 +604,19 @@ class Wild(_Symbolic):
   '''
   wilds will be equal to anything, and are used for pattern matching
   '''
+  __slots__ = ('name', 'kargs')
 
-  @Memoize
+  @InternTable
   def __new__(typ, name, **kargs):
     self = _Symbolic.__new__(typ)
     self.name = name
     self.kargs = kargs
+    self._hash = hash(('Wild', name))
     return self
 
+  def __reduce__(self):
+    return (_unpickle, (Wild, self.name, self.kargs))
+
   def __str__(self):
     return self.name
 
@@ -374,17 +639,22 @@ class Symbol(_Symbolic):
   symbols with the same name and kargs will be equal
   (and in fact are guaranteed to be the same instance)
   '''
+  __slots__ = ('name', 'kargs', 'is_integer', 'is_bitvector', 'is_bool')
 
-  @Memoize
+  @InternTable
   def __new__(typ, name, **kargs):
-    self = Wild.__new__(typ, name)
+    self = _Symbolic.__new__(typ)
     self.name = name
     self.kargs = kargs
+    self._hash = hash(('Symbol', name))
     self.is_integer = False # set to true to force domain to integers
     self.is_bitvector = 0 # set to the size of the bitvector if it is a bitvector
     self.is_bool = False # set to true if the symbol represents a boolean value
     return self
 
+  def __reduce__(self):
+    return (_unpickle, (Symbol, self.name, self.kargs, self.is_integer, self.is_bitvector, self.is_bool))
+
   def __str__(self):
     return self.name
 
@@ -403,41 +673,55 @@ class Symbol(_Symbolic):
         }
 
 
+def _fn_arguments(typ, fn, *args):
+  # the head and operands of an application as it is interned, so x + 1 and
+  # x + symbolic(1) are the same entry
+  if None in args:
+    raise BaseException('NONE IN ARGS %s %s' % (fn, args))
+
+  if not isinstance(fn, _Symbolic):
+    fn = symbolic(fn)
+
+  for i in args:
+    if not isinstance(i, _Symbolic):
+      args = tuple(map(symbolic, args))
+      break
+
+  return (typ, fn) + args
+
 class Fn(_Symbolic):
+  # name and kargs are not stored per node, they are read from the head
+  # which every application of the same operator shares
+  __slots__ = ('fn', 'args')
 
-  @Memoize
+  @InternTable.Converting(_fn_arguments)
   def __new__(typ, fn, *args):
     '''
     arguments: Function, *arguments, **kargs
     valid keyword args:
       commutative (default False) - order of operands is unimportant
     '''
-
-    if None in args:
-      raise BaseException('NONE IN ARGS %s %s' % (fn, args))
-
-    if not isinstance(fn, _Symbolic):
-      fn = symbolic(fn)
-      return Fn.__new__(typ, fn, *args)
-
-    for i in args:
-      if not isinstance(i, _Symbolic):
-        args = list(map(symbolic, args))
-        return Fn.__new__(typ, fn, *args)
-
     self = _Symbolic.__new__(typ)
-    kargs = fn.kargs
-    self.kargs = fn.kargs
-
-    self.name = fn.name
     self.fn = fn
     self.args = args
+    self._hash = hash((fn,) + args)
 
     #import simplify
     #rv = simplify.simplify(self)
 
     return self
 
+  @property
+  def name(self):
+    return self.fn.name
+
+  @property
+  def kargs(self):
+    return self.fn.kargs
+
+  def __reduce__(self):
+    return (Fn, (self.fn,) + self.args)
+
   def _dump(self):
     return {
         'id': id(self),
@@ -452,23 +736,13 @@ class Fn(_Symbolic):
   def __call__(self, *args):
     return Fn(self, *args)
 
-  def substitute(self, subs):
-    args = list(map(lambda x: x.substitute(subs), self.args))
-    newfn = self.fn.substitute(subs)
-    self = Fn(newfn, *args)
-
-    if self in subs:
-      self = subs[self]
-
-    return self
-
   def recursive_substitute(self, subs):
-    y = self
-    while True:
-      x = y.substitute(subs)
-      if x == y:
-        return x
-      y = x
+    '''
+    takes a dictionary of substitutions
+    returns itself with substitutions made until none of them apply anymore
+    '''
+    import substitution
+    return substitution.recursive_substitute(self, subs)
 
   def __getitem__(self, n):
     if n == 0:
@@ -480,7 +754,6 @@ class Fn(_Symbolic):
     return len(self.args) + 1
 
   def _get_assoc_arguments(self):
-    import simplify
     rv = []
 
     args = list(self.args)
@@ -491,7 +764,7 @@ class Fn(_Symbolic):
       if (isinstance(b, Fn) and b.fn == self.fn) and not (isinstance(a, Fn) and a.fn == self.fn):
         return 1
 
-      return simplify._order(a, b)
+      return cmp(a.sort_key, b.sort_key)
 
     args.sort(_)
 
@@ -561,14 +834,47 @@ class Fn(_Symbolic):
     return Fn(stdops.BitXor, lhs, rhs)
 
   def __str__(self):
-    if isinstance(self.fn, Symbol) and not self.name[0].isalnum() and len(self.args) == 2:
-      return '(%s %s %s)' % (self.args[0], self.name, self.args[1])
+    if isinstance(self.fn, Symbol) and not self.name[0].isalnum() and len(self.args) >= 2:
+      return '(%s)' % ((' %s ' % (self.name,)).join(map(str, self.args)),)
 
     return '%s(%s)' % (self.fn, ','.join(map(str, self.args)))
 
   def __repr__(self):
     return str(self)
 
+class DomainError(Exception):
+  pass
+
+def _domain_symbol(typ, name, kargs, domain):
+  '''
+  returns the symbol name with the domain flags (is_integer, is_bitvector,
+  is_bool) in domain, as read back from storage.  the flags are only set on
+  a symbol that isn't live yet, a live one keeps its own and they must agree
+  '''
+  live = typ.__new__.get(typ, name, **kargs)
+  rv = typ(name, **kargs)
+  domain = (bool(domain[0]), int(domain[1]), bool(domain[2]))
+  if live is None:
+    rv.is_integer, rv.is_bitvector, rv.is_bool = domain
+  elif (bool(rv.is_integer), int(rv.is_bitvector), bool(rv.is_bool)) != domain:
+    raise DomainError("%s is live with domain %r, not %r" %
+        (name, (rv.is_integer, rv.is_bitvector, rv.is_bool), domain))
+  return rv
+
+def _unpickle(typ, name, kargs, *domain):
+  if len(domain) > 0:
+    return _domain_symbol(typ, name, kargs, domain)
+  return typ(name, **kargs)
+
+def intern_stats():
+  '''
+  returns a dictionary of class name => intern table counters (live, hits, misses)
+  '''
+  rv = {}
+  for cls in (Boolean, Number, Wild, Symbol, Fn):
+    rv[cls.__name__] = cls.__new__.stats()
+  return rv
+
 def symbols(symstr=None, **kargs):
   '''
   takes a string of symbols seperated by whitespace
@@ -611,7 +917,11 @@ def symbolic(obj, **kargs):
   '''
   makes the symbolic version of an object
   '''
-  if type(obj) in [type(0), type(0.0), type(0L), numpy.int32]:
+  if type(obj) in [type(0), type(0.0), type(0L)]:
+    return Number(obj, **kargs)
+  elif 'numpy' in sys.modules and type(obj) == sys.modules['numpy'].int32:
+    # numpy is only loaded by the features that need it, if it isn't
+    # loaded yet obj can't be one of its types
     return Number(obj, **kargs)
   elif type(obj) == type('str'):
     return Symbol(obj, **kargs)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+'''
+pattern search over large collections of expressions
+
+a Corpus indexes its expressions by head and arity and by the symbols they
+contain, so a query only runs the matcher on the expressions that could
+possibly match: a pattern f(a, x) is only tried on applications of f to two
+arguments that contain x.  matches are streamed as they are found
+
+  corpus = Corpus(expressions)
+  a, b = wilds('a b')
+  for exp, vals in corpus.search(a * (b + 4)):
+    print exp, vals.a, vals.b
+
+with processes=N the matcher runs in a pool of N worker processes, the
+expressions are sent to them pickled, in chunks
+'''
+
+import heapq
+import multiprocessing
+
+import core
+import match
+import rewrite
+
+def _fits(key, pattern_key, ac):
+  if pattern_key == None:
+    return True
+  elif pattern_key[0] == None:
+    return key[1] == pattern_key[1]
+  elif ac and pattern_key[1] >= 0:
+    # ac patterns only look at the head, the operands are flattened
+    return key[0] is pattern_key[0] and key[1] >= 0
+  elif pattern_key[1] >= 2 and match._is_ac(pattern_key[0]):
+    # so are flattened applications, see match.Pattern
+    return key[0] is pattern_key[0] and key[1] >= pattern_key[1]
+  return key == pattern_key
+
+def _search_chunk(job):
+  pattern, ac, start, exps = job
+  p = match.compile(pattern, ac=ac)
+  rv = []
+  for i, exp in enumerate(exps):
+    m = p.bind(exp)
+    if m != None:
+      vals = {}
+      match._fill(vals, zip(p.names, m))
+      rv.append((start + i, vals))
+  return rv
+
+class Corpus(object):
+  '''
+  a sequence of expressions indexed for pattern search, see search
+  '''
+
+  def __init__(self, exps=()):
+    self.exps = []
+    # (head, arity) => indexes of the expressions, in order, and symbol =>
+    # indexes of the expressions containing it, in order.  built on the first
+    # query, expressions added after that are indexed on the next one
+    self.by_key = {}
+    self.by_symbol = {}
+    self.indexed = 0
+    self.extend(exps)
+
+  def add(self, exp):
+    self.exps.append(core.symbolic(exp))
+    return len(self.exps) - 1
+
+  def _index(self):
+    by_key, by_symbol = self.by_key, self.by_symbol
+    for i in xrange(self.indexed, len(self.exps)):
+      exp = self.exps[i]
+      by_key.setdefault(rewrite._key(exp), []).append(i)
+      for s in exp.free_symbols:
+        by_symbol.setdefault(s, []).append(i)
+    self.indexed = len(self.exps)
+
+  def extend(self, exps):
+    for exp in exps:
+      self.add(exp)
+
+  def __len__(self):
+    return len(self.exps)
+
+  def __iter__(self):
+    return iter(self.exps)
+
+  def __getitem__(self, idx):
+    return self.exps[idx]
+
+  def candidates(self, pattern, ac=False):
+    '''
+    returns the indexes, in order, of the expressions that could match
+    pattern, any other expression certainly doesn't
+    '''
+    pattern = core.symbolic(pattern)
+    pattern_key = rewrite._pattern_key(pattern)
+    self._index()
+
+    keys = [k for k in self.by_key if _fits(k, pattern_key, ac)]
+    if len(keys) == 1:
+      rv = self.by_key[keys[0]]
+    else:
+      rv = list(heapq.merge(*[self.by_key[k] for k in keys]))
+
+    # whatever the bindings, the symbols of the pattern are still there
+    required = pattern.free_symbols
+    if len(required) == 0:
+      return list(rv)
+
+    postings = min((self.by_symbol.get(s, []) for s in required), key=len)
+    if len(postings) < len(rv):
+      keys = set(keys)
+      rv = [i for i in postings if rewrite._key(self.exps[i]) in keys]
+    return [i for i in rv if required <= self.exps[i].free_symbols]
+
+  def search(self, pattern, ac=False, processes=None, chunksize=1024):
+    '''
+    yields (expression, WildResults) for every expression of the corpus that
+    matches pattern, in the order of the corpus
+
+    ac is passed on to match.compile.  with processes, the candidates are
+    matched by that many worker processes, chunksize expressions at a time
+    '''
+    pattern = core.symbolic(pattern)
+    indexes = self.candidates(pattern, ac)
+
+    if processes == None:
+      p = match.compile(pattern, ac=ac)
+      for i in indexes:
+        m = p.bind(self.exps[i])
+        if m != None:
+          vals = core.WildResults()
+          match._fill(vals, zip(p.names, m))
+          yield self.exps[i], vals
+      return
+
+    jobs = ((pattern, ac, start, [self.exps[i] for i in indexes[start:start + chunksize]])
+        for start in xrange(0, len(indexes), chunksize))
+    pool = multiprocessing.Pool(processes)
+    try:
+      for found in pool.imap(_search_chunk, jobs):
+        for j, bindings in found:
+          vals = core.WildResults()
+          for k, v in bindings.items():
+            vals[k] = v
+          yield self.exps[indexes[j]], vals
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+
+  def count(self, pattern, ac=False):
+    '''
+    the number of expressions that match pattern
+    '''
+    return sum(1 for m in self.search(pattern, ac))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+'''
+common subexpression elimination
+
+rewrites an expression into let-bound form: a topologically ordered list of
+(symbol, expression) bindings plus a root.  every binding only refers to
+leaves and to symbols bound before it, so consumers (code generation, the z3
+bridge, serialization) do the work for each shared subterm once
+'''
+
+import core
+
+def _children(node):
+  if isinstance(node, core.Fn):
+    return [node.fn] + list(node.args)
+  return []
+
+def _fresh_symbols(exp):
+  taken = set(s.name for s in core.collect(exp, lambda e: isinstance(e, core.Symbol)))
+  i = 0
+  while True:
+    name = '_cse%d' % (i,)
+    i += 1
+    if name not in taken:
+      yield core.Symbol(name)
+
+def references(exp):
+  '''
+  returns a dictionary of id(node) => number of times node is referenced
+  from its parents, for every distinct node in exp (the root counts once)
+  '''
+  rv = {id(exp): 1}
+  stack = [exp]
+  while len(stack) > 0:
+    for c in _children(stack.pop()):
+      if id(c) not in rv:
+        rv[id(c)] = 1
+        stack.append(c)
+      else:
+        rv[id(c)] += 1
+
+  return rv
+
+def cse(exp, threshold=2, symbols=None):
+  '''
+  returns (bindings, root)
+
+  every compound subterm referenced at least threshold times is bound to a
+  fresh symbol, so threshold=1 binds every compound subterm.  symbols is an
+  optional iterable of the symbols to bind to, by default they are named
+  _cse0, _cse1, ... skipping names already used in exp
+
+  Example:
+    x,y = symbols('x y')
+    bindings, root = cse((x + y) * (x + y))
+    # bindings == [(_cse0, x + y)], root == _cse0 * _cse0
+  '''
+  symbols = _fresh_symbols(exp) if symbols == None else iter(symbols)
+  refs = references(exp)
+  rewritten = {}
+  bindings = []
+
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    if id(node) in rewritten:
+      stack.pop()
+      continue
+
+    children = _children(node)
+    pending = [c for c in children if id(c) not in rewritten]
+    if len(pending) > 0:
+      pending.reverse()
+      stack.extend(pending)
+      continue
+
+    stack.pop()
+    if len(children) == 0:
+      rewritten[id(node)] = node
+      continue
+
+    children = [rewritten[id(c)] for c in children]
+    rv = core.Fn(*children)
+    if node is not exp and refs[id(node)] >= threshold:
+      sym = next(symbols)
+      bindings.append((sym, rv))
+      rv = sym
+    rewritten[id(node)] = rv
+
+  return bindings, rewritten[id(exp)]
@@ -1,36 +1,66 @@
 #!/usr/bin/env python
 
-import symath
+import core
+import match
 import memoize
+import stdops
 
-@memoize.Memoize
+_a, _b, _c = core.wilds('a b c')
+# sums and products may be flattened, see simplify.normalize
+_sums = (match.compile(_a + _b, ac=True), match.compile(_a - _b))
+
+def _factors(exp):
+  # the operands of a product, flattened, or exp on its own
+  return match._operands(stdops.Mul, exp)
+
+def _cancel(ys, xs):
+  '''
+  the factors ys without the factors xs, each taken out as many times as it
+  appears in xs, or None when they aren't all there
+  '''
+  rv = list(ys)
+  for x in xs:
+    for i in range(len(rv)):
+      if rv[i] is x:
+        del rv[i]
+        break
+    else:
+      return None
+  return rv
+
+def _product(factors):
+  if len(factors) == 0:
+    return core.symbolic(1)
+  elif len(factors) == 1:
+    return factors[0]
+  return core.Fn(stdops.Mul, *factors)
+
+@memoize.Memoize.Bounded(maxsize=65536)
 def is_factor(x, y):
   '''
   return True if x is a factor of y
   will return True for any 2 numbers because we use floating point
   '''
-  a, b = symath.wilds('a b')
-  val = symath.WildResults()
-
   if x == y:
     return True
 
-  elif isinstance(x, symath.Number) and isinstance(y, symath.Number):
+  elif isinstance(x, core.Number) and isinstance(y, core.Number):
     return True
 
-  elif y.match(a * b, val):
-    return is_factor(x, val.a) or is_factor(x, val.b)
-
-  elif y.match(a + b, val):
-    return is_factor(x, val.a) and is_factor(x, val.b)
+  ys = _factors(y)
+  if len(ys) > 1:
+    if _cancel(ys, _factors(x)) != None:
+      return True
+    return any(is_factor(x, a) for a in ys)
 
-  elif y.match(a - b, val):
-    return is_factor(x, val.a) and is_factor(x, val.b)
+  for p in _sums:
+    m = p.bind(y)
+    if m != None:
+      return is_factor(x, m[0]) and is_factor(x, m[1])
 
-  else:
-    return False
+  return False
 
-@memoize.Memoize
+@memoize.Memoize.Bounded(maxsize=65536)
 def get_coefficient(y, x):
   '''
   divides y by x and returns
@@ -39,17 +69,17 @@ def get_coefficient(y, x):
   assert is_factor(x, y)
   assert x != 1
 
-  a,b,c = symath.wilds('a b c')
-  val = symath.WildResults()
-
   if y == x:
-    return symath.symbolic(1)
+    return core.symbolic(1)
 
-  if y.match(a * b, val):
-    if is_factor(x, val.a):
-      return get_coefficient(val.a, x) * val.b
-    else:
-      return get_coefficient(val.b, x) * val.a
+  ys = _factors(y)
+  if len(ys) > 1:
+    rest = _cancel(ys, _factors(x))
+    if rest != None:
+      return _product(rest)
+    for i, a in enumerate(ys):
+      if is_factor(x, a):
+        return _product([get_coefficient(a, x)] + ys[:i] + ys[i + 1:])
 
-  elif y.match(c(a, b), val):
-    return val.c(get_coefficient(val.a, x), get_coefficient(val.b, x))
+  if isinstance(y, core.Fn) and len(y.args) >= 2:
+    return core.Fn(y.fn, *[get_coefficient(a, x) for a in y.args])
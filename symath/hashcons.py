@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+'''
+hash-consing tables for the expression constructors in symath.core
+
+an InternTable wraps a constructor the same way memoize.Memoize does, so that
+calling it twice with the same arguments returns the very same instance, but
+it only holds weak references to what it built.  once nothing else refers to
+an expression it is reclaimed and dropped from the table
+'''
+
+import threading
+import weakref
+
+class InternTable(object):
+  '''
+  intern the results of a constructor:
+  InternTable(myconstructor)
+
+  the results must be weakly referencable, the arguments must be hashable
+
+  the table is split into stripes by the hash of the key, each with its own
+  lock, so threads interning different expressions rarely wait on each
+  other.  lookups that hit don't take a lock at all.  on a miss the instance
+  is built outside the lock and then inserted only if no other thread got
+  there first, otherwise it is thrown away and the other thread's instance is
+  returned, so there is only ever one instance per key.  the hits and misses
+  counters are not locked and can undercount under contention
+
+  convert, if given, is applied to the arguments before they are looked up,
+  it returns them as the tuple the constructor is called with.  arguments
+  that convert to the same tuple share one entry, see InternTable.Converting
+  '''
+
+  STRIPES = 16
+
+  def __init__(self, f, stripes=None, convert=None):
+    self.f = f
+    self.convert = convert
+    self.stripes = [(threading.Lock(), weakref.WeakValueDictionary())
+        for i in range(stripes or InternTable.STRIPES)]
+    self.hits = 0
+    self.misses = 0
+
+  @property
+  def live(self):
+    '''number of interned instances that are still alive'''
+    return sum(len(results) for lock, results in self.stripes)
+
+  def stats(self):
+    return {'live': self.live, 'hits': self.hits, 'misses': self.misses}
+
+  @staticmethod
+  def Converting(convert):
+    '''returns a decorator interning with the arguments passed through convert'''
+    return lambda f: InternTable(f, convert=convert)
+
+  def clear_stats(self):
+    self.hits = 0
+    self.misses = 0
+
+  def _stripe(self, args, kargs):
+    if kargs:
+      key = (args, tuple(sorted(kargs.items())))
+    else:
+      key = args
+    return key, self.stripes[hash(key) % len(self.stripes)]
+
+  def get(self, *args, **kargs):
+    '''
+    returns the live instance built from these arguments, None if there is
+    none, without building one
+    '''
+    if self.convert is not None:
+      args = self.convert(*args)
+    key, (lock, results) = self._stripe(args, kargs)
+    return results.get(key)
+
+  def __call__(self, *args, **kargs):
+    if self.convert is not None:
+      args = self.convert(*args)
+    key, (lock, results) = self._stripe(args, kargs)
+    rv = results.get(key)
+    if rv is not None:
+      self.hits += 1
+      return rv
+
+    self.misses += 1
+    new = self.f(*args, **kargs)
+    with lock:
+      rv = results.get(key)
+      if rv is None:
+        rv = results[key] = new
+    return rv
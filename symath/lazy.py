@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+'''
+modules that are only imported when they are first used
+
+import symath stays cheap this way: simplify, match, the solvers (and z3),
+calculus and functions are loaded the first time one of their attributes is
+looked up
+'''
+
+import importlib
+import sys
+
+class LazyModule(object):
+  '''
+  stands in for the module name until one of its attributes is needed:
+  simplify = LazyModule('symath.simplify')
+  '''
+
+  def __init__(self, name):
+    self.__dict__['_name'] = name
+
+  def _load(self):
+    return importlib.import_module(self._name)
+
+  def __getattr__(self, attr):
+    return getattr(self._load(), attr)
+
+  def __setattr__(self, attr, value):
+    setattr(self._load(), attr, value)
+
+  def __dir__(self):
+    return dir(self._load())
+
+  def __repr__(self):
+    if self._name in sys.modules:
+      return repr(sys.modules[self._name])
+    return "<lazy module '%s'>" % (self._name,)
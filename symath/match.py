@@ -1,37 +1,62 @@
 #!/usr/bin/env python
 
+from collections import deque
 import core
+import traversal
+from memoize import Memoize
 
 def extract(a,b,rv=None):
   '''
   extract values from an expression
   returns a dictionary of wild names => values where b contains the wilds
+
+  the pattern is interpreted as it is walked, which is the cheapest way to
+  match it once, see compile for patterns that are used over and over
   '''
   if rv == None:
     rv = {}
+  bound = dict(rv)
+
+  stack = [(a, b)]
+  while len(stack) > 0:
+    e, p = stack.pop()
+    if isinstance(p, core.Wild):
+      if p.name in rv:
+        if rv[p.name] != e:
+          return None
+      else:
+        rv[p.name] = e
 
-  if isinstance(b, core.Wild):
-    if b.name in rv and rv[b.name] != a:
+    elif isinstance(p, core.Fn) and len(p.args) > 0:
+      if not isinstance(e, core.Fn):
+        return None
+      if len(e.args) != len(p.args):
+        if len(e.args) > len(p.args) and e.fn is p.fn and _is_ac(p.fn):
+          # flattened, matched again with its operands as a multiset, the
+          # rest of the pattern still by position
+          return _extract_ac(a, b, bound, rv)
+        return None
+      stack.extend(reversed(zip((e.fn,) + e.args, (p.fn,) + p.args)))
+
+    elif e != p:
       return None
-    rv[b.name] = a
-    return rv
 
-  elif len(a) != len(b):
-    return None
+  return rv
 
-  elif len(b) > 1:
-    for i in range(len(b)):
-      if extract(a[i], b[i], rv) == None:
-        return None
+def _extract_ac(a, b, bound, rv):
+  for nb in _ac_match(b, a, bound, True):
+    rv.clear()
+    rv.update(nb)
     return rv
+  return None
 
-  elif a == b:
-    return a
-
-  else:
-    return None
+def _fill(valuestore, bindings):
+  for k, v in bindings:
+    if isinstance(v, core.Wild) and v == core.wild(k):
+      continue
+    valuestore[k] = v
 
-def match(a, b, valuestore=None):
+def match(a, b, valuestore=None, ac=False):
   '''
   matches against a pattern, use wilds() to generate wilds
 
@@ -42,19 +67,413 @@ def match(a, b, valuestore=None):
     if exp.match(a(b + 4), val):
       print val.a
       print val.b
+
+  with ac=True, applications of associative and commutative operators match
+  whatever the order and grouping of their operands, see ACPattern.  without
+  it they match by position, unless they're flattened, see Pattern
+
+  the pattern isn't compiled, use compile for patterns matched many times
   '''
 
+  if ac:
+    return ACPattern(b).match(a, valuestore)
+
   if valuestore != None:
     valuestore.clear()
 
-  d = extract(a,b)
+  d = extract(a, b)
   if d == None:
     return False
 
   if valuestore != None:
-    for k in d:
-      if d[k] == core.wild(k):
-        continue
-      valuestore[k] = d[k]
+    _fill(valuestore, d.items())
 
   return True
+
+def _names(pattern, names):
+  if names == None:
+    names = sorted(set(w.name for w in traversal.collect(pattern, lambda e: isinstance(e, core.Wild))))
+  elif isinstance(names, str):
+    names = names.split()
+  return tuple(names)
+
+def _source(pattern, names):
+  '''
+  returns the source of a function binding the wilds of pattern
+
+  the pattern is unrolled breadth first into straight line code, checking
+  each function application's arity and then its head before looking at its
+  arguments, and binding every wild to a fixed local, so the only thing left
+  to do at match time is run through the checks
+
+  an application of an associative and commutative operator with more
+  operands than the pattern has is flattened, the pattern is then matched
+  again by _fallback, see Pattern
+  '''
+  consts = {}
+  lines = ['def _bind(e0):']
+  slots = {}
+  count = [0]
+
+  def _reg():
+    count[0] += 1
+    return 'e%d' % (count[0],)
+
+  def _const(node):
+    if id(node) not in consts:
+      consts[id(node)] = ('k%d' % (len(consts),), node)
+    return consts[id(node)][0]
+
+  queue = deque([(pattern, 'e0')])
+  while len(queue) > 0:
+    p, r = queue.popleft()
+    if isinstance(p, core.Wild):
+      if p.name in slots:
+        lines.append('  if %s is not %s: return None' % (r, slots[p.name]))
+      else:
+        slots[p.name] = r
+
+    elif isinstance(p, core.Fn) and len(p.args) > 0:
+      if _is_ac(p.fn) and not isinstance(p.fn, core.Fn):
+        lines.append('  if not isinstance(%s, Fn): return None' % (r,))
+        lines.append('  if len(%s.args) != %d: return _fallback(e0) if %s.fn is %s and len(%s.args) > %d else None'
+            % (r, len(p.args), r, _const(p.fn), r, len(p.args)))
+      else:
+        lines.append('  if not isinstance(%s, Fn) or len(%s.args) != %d: return None' % (r, r, len(p.args)))
+      if isinstance(p.fn, core.Wild) or isinstance(p.fn, core.Fn):
+        head = _reg()
+        lines.append('  %s = %s.fn' % (head, r))
+        queue.append((p.fn, head))
+      else:
+        lines.append('  if %s.fn is not %s: return None' % (r, _const(p.fn)))
+
+      args = [_reg() for a in p.args]
+      lines.append('  %s, = %s.args' % (', '.join(args), r))
+      queue.extend(zip(p.args, args))
+
+    else:
+      # interned, so equal leaves are the same instance
+      lines.append('  if %s is not %s: return None' % (r, _const(p)))
+
+  lines.append('  return (%s)' % (''.join(slots[n] + ', ' for n in names),))
+  env = dict(consts.values())
+  env['Fn'] = core.Fn
+  return '\n'.join(lines) + '\n', env
+
+# patterns with more nodes than this aren't turned into code, generating it
+# costs more than interpreting them
+_COMPILE_LIMIT = 256
+
+class Pattern(object):
+  '''
+  a pattern compiled once into a specialized matcher, see compile
+
+  bind(exp) is the fast path: it returns the values of the wilds, in the
+  order of names, or None when exp doesn't match.  patterns without wilds
+  and large ones are interpreted by extract instead
+
+  the arguments are matched by position, except that the operands of
+  flattened applications of associative and commutative operators,
+  (x + y + z), are matched as multisets like an ACPattern would, and the
+  last wild takes the operands left over, y + z for x + a.  everywhere else
+  the pattern is still matched by position.  a wild head matches by arity
+  only, a(b, c) doesn't match x + y + z
+  '''
+
+  def __init__(self, pattern, names=None):
+    self.pattern = pattern
+    self.names = _names(pattern, names)
+    if not pattern.has_wilds or pattern.size > _COMPILE_LIMIT:
+      self.source = None
+      self.bind = self._interpret
+      return
+
+    self.source, env = _source(pattern, self.names)
+    env['_fallback'] = self._flattened
+    exec self.source in env
+    self.bind = env['_bind']
+
+  def _flattened(self, exp):
+    for b in _ac_match(self.pattern, exp, {}, True):
+      return tuple(b[n] for n in self.names)
+    return None
+
+  def _interpret(self, exp):
+    rv = extract(exp, self.pattern)
+    if rv == None:
+      return None
+    return tuple(rv[n] for n in self.names)
+
+  def extract(self, exp):
+    '''
+    like extract, returns a dictionary of wild names => values or None
+    '''
+    rv = self.bind(exp)
+    if rv == None:
+      return None
+    return dict(zip(self.names, rv))
+
+  def match(self, exp, valuestore=None):
+    '''
+    like match, fills valuestore with the values of the wilds
+    '''
+    if valuestore != None:
+      valuestore.clear()
+
+    rv = self.bind(exp)
+    if rv == None:
+      return False
+
+    if valuestore != None:
+      _fill(valuestore, zip(self.names, rv))
+
+    return True
+
+  def __str__(self):
+    return str(self.pattern)
+
+  def __repr__(self):
+    return 'Pattern(%s)' % (self.pattern,)
+
+def _is_ac(fn):
+  kargs = getattr(fn, 'kargs', {})
+  return kargs.get('associative', False) and kargs.get('commutative', False)
+
+def _is_commutative(fn):
+  return getattr(fn, 'kargs', {}).get('commutative', False)
+
+def _operands(fn, exp):
+  '''
+  the operands of exp as an application of the associative fn, flattened
+  '''
+  rv = []
+  stack = [exp]
+  while len(stack) > 0:
+    e = stack.pop()
+    if isinstance(e, core.Fn) and e.fn is fn:
+      stack.extend(reversed(e.args))
+    else:
+      rv.append(e)
+  return rv
+
+def _apply(fn, operands):
+  # flattened, like simplify leaves them
+  if len(operands) == 1:
+    return operands[0]
+  return core.Fn(fn, *operands)
+
+def _remove(operands, removed):
+  rv = list(operands)
+  for o in removed:
+    for i in range(len(rv)):
+      if rv[i] is o:
+        del rv[i]
+        break
+    else:
+      return None
+  return rv
+
+def _divide(operands, count):
+  # each distinct operand must appear a multiple of count times
+  counts = {}
+  order = []
+  for o in operands:
+    if id(o) not in counts:
+      counts[id(o)] = 0
+      order.append(o)
+    counts[id(o)] += 1
+
+  rv = []
+  for o in order:
+    if counts[id(o)] % count != 0:
+      return None
+    rv.extend([o] * (counts[id(o)] / count))
+  return rv
+
+def _ac_match(p, s, b, flat=False):
+  '''
+  yields every way of extending the bindings b (wild name => value) so that
+  the pattern p matches s
+
+  with flat, only the applications of s that are flattened, with more
+  operands than p has, are matched as multisets, the rest by position as
+  Pattern does
+  '''
+  if isinstance(p, core.Wild):
+    v = b.get(p.name)
+    if v is None:
+      nb = dict(b)
+      nb[p.name] = s
+      yield nb
+    elif v is s:
+      yield b
+    return
+
+  if not isinstance(p, core.Fn) or len(p.args) == 0:
+    if p is s:
+      yield b
+    return
+
+  if not isinstance(s, core.Fn):
+    return
+
+  if flat:
+    ac = (_is_ac(p.fn) and not isinstance(p.fn, core.Fn) and s.fn is p.fn
+        and len(s.args) > len(p.args))
+  else:
+    ac = _is_ac(p.fn)
+
+  if ac:
+    if s.fn is p.fn:
+      for nb in _ac_operands(p.fn, _operands(p.fn, p), _operands(p.fn, s), b, flat):
+        yield nb
+    return
+
+  if len(p.args) != len(s.args):
+    return
+
+  orders = [s.args]
+  if len(s.args) == 2 and _is_commutative(p.fn) and not flat:
+    orders.append(s.args[::-1])
+
+  for args in orders:
+    for nb in _ac_sequence((p.fn,) + p.args, (s.fn,) + args, b, 0, flat):
+      yield nb
+
+def _ac_sequence(ps, ss, b, i, flat):
+  if i == len(ps):
+    yield b
+    return
+
+  for nb in _ac_match(ps[i], ss[i], b, flat):
+    for rv in _ac_sequence(ps, ss, nb, i + 1, flat):
+      yield rv
+
+def _ac_operands(fn, ps, ss, b, flat):
+  fixed = [p for p in ps if not isinstance(p, core.Wild)]
+  wilds = [p.name for p in ps if isinstance(p, core.Wild)]
+  for nb, rest in _ac_fixed(fixed, ss, b, flat):
+    for rv in _ac_wilds(fn, wilds, rest, nb):
+      yield rv
+
+def _ac_fixed(fixed, ss, b, flat):
+  # the operands of the pattern that aren't wilds each take one operand
+  if len(fixed) == 0:
+    yield b, ss
+    return
+
+  seen = set()
+  for i in range(len(ss)):
+    if id(ss[i]) in seen:
+      continue
+    seen.add(id(ss[i]))
+    for nb in _ac_match(fixed[0], ss[i], b, flat):
+      for rv in _ac_fixed(fixed[1:], ss[:i] + ss[i + 1:], nb, flat):
+        yield rv
+
+def _ac_wilds(fn, wilds, rest, b):
+  # wilds that are already bound take their value's operands
+  free = []
+  for name in sorted(set(wilds), key=wilds.index):
+    count = wilds.count(name)
+    if name in b:
+      rest = _remove(rest, _operands(fn, b[name]) * count)
+      if rest == None:
+        return
+    else:
+      free.append((name, count))
+
+  for rv in _ac_free(fn, free, rest, b):
+    yield rv
+
+def _ac_free(fn, free, rest, b):
+  # every free wild but the last takes one operand, the last takes the rest
+  if len(free) == 0:
+    if len(rest) == 0:
+      yield b
+    return
+
+  if len(rest) < len(free):
+    return
+
+  name, count = free[0]
+  if len(free) == 1:
+    operands = _divide(rest, count)
+    if operands != None:
+      nb = dict(b)
+      nb[name] = _apply(fn, operands)
+      yield nb
+    return
+
+  seen = set()
+  for o in rest:
+    if id(o) in seen:
+      continue
+    seen.add(id(o))
+    remaining = _remove(rest, [o] * count)
+    if remaining != None:
+      nb = dict(b)
+      nb[name] = o
+      for rv in _ac_free(fn, free[1:], remaining, nb):
+        yield rv
+
+class ACPattern(Pattern):
+  '''
+  a pattern matched modulo associativity and commutativity
+
+  applications of operators flagged both associative and commutative (like
+  stdops.Add and stdops.Mul) are flattened, and the operands of the pattern
+  are matched against the operands of the expression as multisets, so
+  a + (a * b) matches (y * x) + x and x + (x * y) alike.  every operand of
+  the pattern takes at least one operand of the expression; when several
+  wilds share them, all but the last one take a single operand.  the
+  operands of commutative-only operators are tried in both orders
+
+  bind returns the first match found
+  '''
+
+  def __init__(self, pattern, names=None):
+    self.pattern = pattern
+    self.names = _names(pattern, names)
+    if isinstance(pattern, core.Fn) and len(pattern.args) > 0 and not pattern.fn.has_wilds:
+      self.head = pattern.fn
+    else:
+      self.head = None
+
+  def bind(self, exp):
+    if self.head is not None and not (isinstance(exp, core.Fn) and exp.fn is self.head):
+      return None
+
+    for b in _ac_match(self.pattern, exp, {}):
+      return tuple(b[n] for n in self.names)
+    return None
+
+  def __repr__(self):
+    return 'ACPattern(%s)' % (self.pattern,)
+
+@Memoize.Bounded(maxsize=4096)
+def _compile(pattern, names, ac):
+  if ac:
+    return ACPattern(pattern, names)
+  return Pattern(pattern, names)
+
+def compile(pattern, names=None, ac=False):
+  '''
+  returns pattern compiled into a Pattern, compiled patterns are cached
+
+  names (a list or a space separated string) sets the order in which
+  Pattern.bind returns the values of the wilds, by default they are sorted
+  by name.  with ac=True the pattern is an ACPattern
+
+  Example:
+    a,b = wilds('a b')
+    times_four = compile(a * (b + 4))
+
+    m = times_four.bind(exp)
+    if m != None:
+      print m[0], m[1]
+  '''
+  # the cache is keyed by the arguments, so they must be hashable
+  if names != None:
+    names = _names(pattern, names)
+  return _compile(pattern, names, ac)
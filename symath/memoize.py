@@ -1,5 +1,164 @@
 #!/usr/bin/env python
 import pprint
+import sys
+import types
+import weakref
+from collections import OrderedDict
+
+LRU = 'lru'
+LFU = 'lfu'
+
+# every Memoize that is alive, see caches() and clear_all()
+_registry = weakref.WeakSet()
+
+# separates positional arguments from keyword arguments in cache keys
+_KARGS = object()
+
+class _BoundedResults(object):
+    '''
+    base of the bounded result stores, a mapping that evicts entries once it
+    holds more than maxsize entries or more than maxbytes bytes (as measured
+    by sizeof on the key and the value, shallow by default)
+    '''
+    def __init__(self, maxsize=None, maxbytes=None, sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        if maxbytes != None:
+            self.sizeof = lambda k, v: sizeof(k) + sizeof(v)
+        else:
+            self.sizeof = lambda k, v: 0
+        self.bytes = 0
+        self.evictions = 0
+        self.clear()
+
+    def _full(self, size):
+        # whether adding an entry of size bytes would go over the bounds
+        return (self.maxsize != None and len(self) >= self.maxsize) or \
+            (self.maxbytes != None and self.bytes + size > self.maxbytes)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._remove(key)
+        # evict before inserting, so the new entry can't be the victim
+        size = self.sizeof(key, value)
+        while len(self) > 0 and self._full(size):
+            self._remove(self._victim())
+            self.evictions += 1
+        self._insert(key, value, size)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.data.keys())
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+class LRUResults(_BoundedResults):
+    '''
+    evicts the least recently used entry first
+    '''
+    def clear(self):
+        # links are [prev, next, key, value, size] in a circular list,
+        # root.next is the least recently used entry
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, 0]
+        self.data = {}
+        self.bytes = 0
+
+    def __getitem__(self, key):
+        link = self.data[key]
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+        last = self.root[0]
+        last[1] = self.root[0] = link
+        link[0] = last
+        link[1] = self.root
+        return link[3]
+
+    def _insert(self, key, value, size):
+        last = self.root[0]
+        link = [last, self.root, key, value, size]
+        last[1] = self.root[0] = self.data[key] = link
+        self.bytes += size
+
+    def _remove(self, key):
+        link = self.data.pop(key)
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+        self.bytes -= link[4]
+
+    def _victim(self):
+        return self.root[1][2]
+
+    def values(self):
+        return [link[3] for link in self.data.values()]
+
+    def items(self):
+        return [(k, link[3]) for k, link in self.data.items()]
+
+class LFUResults(_BoundedResults):
+    '''
+    evicts the least frequently used entry first, the least recently used
+    one among those used equally often
+    '''
+    def clear(self):
+        # key -> [count, size, value]
+        self.data = {}
+        # count -> keys used that many times, oldest first
+        self.counts = {}
+        self.mincount = 0
+        self.bytes = 0
+
+    def _touch(self, key, entry):
+        keys = self.counts[entry[0]]
+        del keys[key]
+        if len(keys) == 0:
+            del self.counts[entry[0]]
+            if self.mincount == entry[0]:
+                self.mincount += 1
+        entry[0] += 1
+        self.counts.setdefault(entry[0], OrderedDict())[key] = None
+
+    def __getitem__(self, key):
+        entry = self.data[key]
+        self._touch(key, entry)
+        return entry[2]
+
+    def _insert(self, key, value, size):
+        self.data[key] = [1, size, value]
+        self.counts.setdefault(1, OrderedDict())[key] = None
+        self.mincount = 1
+        self.bytes += size
+
+    def _remove(self, key):
+        entry = self.data.pop(key)
+        keys = self.counts[entry[0]]
+        del keys[key]
+        if len(keys) == 0:
+            del self.counts[entry[0]]
+            if self.mincount == entry[0]:
+                self.mincount = min(self.counts) if len(self.counts) > 0 else 0
+        self.bytes -= entry[1]
+
+    def _victim(self):
+        return next(iter(self.counts[self.mincount]))
+
+    def values(self):
+        return [entry[2] for entry in self.data.values()]
+
+    def items(self):
+        return [(k, entry[2]) for k, entry in self.data.items()]
+
+_POLICIES = {LRU: LRUResults, LFU: LFUResults}
 
 class Memoize(object):
     ''' 
@@ -7,15 +166,45 @@ class Memoize(object):
         Memoize(myfunc)
 
         used to cache results from functions so that they are not called multiple times
+
+        by default results are kept forever, pass maxsize (number of results)
+        and/or maxbytes to bound the cache, and policy (LRU or LFU) to choose
+        what is evicted first.  Memoize.Bounded makes a decorator:
+        @Memoize.Bounded(maxsize=1024)
+
+        hits, misses and evictions are counted per cache
     '''
-    def __init__(self, f, results=None):
+    def __init__(self, f, results=None, maxsize=None, maxbytes=None, policy=LRU, sizeof=sys.getsizeof):
         self.f = f
+        self.hits = 0
+        self.misses = 0
+        if results == None and (maxsize != None or maxbytes != None):
+            results = _POLICIES[policy](maxsize, maxbytes, sizeof)
         self.results = results if results != None else {}
-        self.noargs = object()
+        _registry.add(self)
+
+    @property
+    def name(self):
+        return '%s.%s' % (getattr(self.f, '__module__', None), getattr(self.f, '__name__', self.f))
+
+    @property
+    def evictions(self):
+        return getattr(self.results, 'evictions', 0)
+
+    def stats(self):
+        return {'size': len(self.results), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear_stats(self):
+        self.hits = 0
+        self.misses = 0
+        if hasattr(self.results, 'evictions'):
+            self.results.evictions = 0
 
     def clear_results(self):
-      self.noargs = object()
-      self.results = {}
+      if type(self.results) is dict:
+        self.results = {}
+      else:
+        self.results.clear()
 
     def __exit__(self,type,value,traceback):
         pass
@@ -24,44 +213,46 @@ class Memoize(object):
         return self
 
     def __call__(self, *args, **kargs):
-        #import bnrev.symbolic as sym
-
-        # get our kargs into a standard format
-        kkeys = list(kargs.keys())
-        kkeys.sort()
-        kkeys = tuple(kkeys)
-        kvals = tuple(map(lambda k: kargs[k], kkeys))
-
-        # finally make our key
-        key = (tuple(args), kkeys, kvals)
-
-        #for i in args:
-        #  if isinstance(i, sym.Number) and i.n == -0x88:
-        #    print key
-
-        # magic value for functions that have no arguments.. this requires slightly different logic
-        skipargs = False
-        if len(args) == 0 and len(kargs) == 0:
-            key = self.noargs
-            skipargs = True
-
-        # if we haven't called the function with the arguments yet, do it
-        if key not in self.results:
-            #print key
-            tmp = self.f(*args, **kargs) if not skipargs else self.f()
-
-            # generators only work once, so we have to expand them to lists in order for
-            # memoization to work
-            if type(tmp) is type(x for x in (0,)):
-                tmp = list(tmp)
-
-            self.results[key] = tmp
+        # the positional arguments are the key on their own when there are no kargs
+        if kargs:
+            key = (args, _KARGS, tuple(sorted(kargs.items())))
         else:
-            #print 'memoized!'
+            key = args
+
+        try:
+            rv = self.results[key]
+        except KeyError:
             pass
+        else:
+            self.hits += 1
+            return rv
+
+        self.misses += 1
+        rv = self.f(*args, **kargs)
+
+        # generators only work once, so we have to expand them to lists in order for
+        # memoization to work
+        if type(rv) is types.GeneratorType:
+            rv = list(rv)
+
+        self.results[key] = rv
+        return rv
 
-        # return the cached results
-        return self.results[key]
+    @staticmethod
+    def Persistent(path, name=None, maxsize=None, maxbytes=None, policy=LRU):
+        '''
+        returns a decorator memoizing into the sqlite database at path, in
+        front of an in-process cache bounded like Memoize.Bounded, see persist
+        '''
+        def _(f):
+            import persist
+            return persist.attach(Memoize(f, maxsize=maxsize, maxbytes=maxbytes, policy=policy), path, name)
+        return _
+
+    @staticmethod
+    def Bounded(maxsize=None, maxbytes=None, policy=LRU, sizeof=sys.getsizeof):
+        '''returns a decorator memoizing with a bounded cache, see Memoize'''
+        return lambda f: Memoize(f, maxsize=maxsize, maxbytes=maxbytes, policy=policy, sizeof=sizeof)
 
     @staticmethod
     def MemoizeObject(obj, *memmethods):
@@ -109,6 +300,22 @@ class Memoize(object):
                 setattr(obj, membername, value.f)
         return obj
 
+def caches():
+    '''returns every Memoize that is alive'''
+    return list(_registry)
+
+def cache_stats():
+    '''returns the stats of every Memoize that is alive, by name'''
+    rv = {}
+    for c in caches():
+        rv.setdefault(c.name, []).append(c.stats())
+    return rv
+
+def clear_all():
+    '''drops the results of every Memoize that is alive'''
+    for c in caches():
+        c.clear_results()
+
 class m(object):
     ''' 
     special class used for with statements to implement (dynamicly) scoped memoization 
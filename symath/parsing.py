@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+'''
+reads expressions back from the text printed by str()
+
+the notation is the one Fn.__str__ produces: applications of operator
+symbols to two or more arguments are infix and fully parenthesized, (a + b)
+or (a + b + c) when flattened, everything else is head(arg,arg,...).  the
+heads can themselves be expressions, (x + y)(z)
+
+operator symbols are resolved to the ones in stdops so the result simplifies
+like the original.  wilds print the same as symbols and are read back as
+symbols, numbers print as in Number.__str__ (inf and nan can't be read back)
+
+parsing uses an explicit stack of open parentheses, never python recursion,
+so deep expressions are fine
+'''
+
+import re
+import core
+import stdops
+
+class ParseError(Exception):
+  pass
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+      (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+     |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+     |(?P<punct>[(),])
+     |(?P<op>[^\sA-Za-z0-9_(),]+)
+    )''', re.VERBOSE)
+
+_operators = dict((v.name, v) for v in vars(stdops).values() if isinstance(v, core.Symbol))
+
+def _atom(kind, tok):
+  if kind == 'number':
+    return core.Number(float(tok))
+  elif tok == 'True':
+    return core.Boolean(True)
+  elif tok == 'False':
+    return core.Boolean(False)
+  elif tok in _operators:
+    return _operators[tok]
+  else:
+    return core.Symbol(tok)
+
+def _tokens(text):
+  pos = 0
+  end = len(text.rstrip())
+  while pos < end:
+    m = _TOKEN.match(text, pos)
+    if m == None:
+      raise ParseError("unexpected character at %d in %r" % (pos, text))
+    pos = m.end()
+    yield m.lastgroup, m.group(m.lastgroup)
+
+class Parser(object):
+  '''
+  parses expressions, reusing the atoms it has already seen
+
+  a Parser can be kept around for a whole corpus, see parse_lines
+  '''
+
+  def __init__(self):
+    self.atoms = {}
+
+  def atom(self, kind, tok):
+    if tok not in self.atoms:
+      self.atoms[tok] = _atom(kind, tok)
+    return self.atoms[tok]
+
+  def parse(self, text):
+    # frames are [head, args] for head(...) and [None, [op, args...]] for
+    # (a op b op ...)
+    stack = []
+    value = None
+
+    for kind, tok in _tokens(text):
+      if value == None:
+        if tok == '(' and kind == 'punct':
+          stack.append([None, []])
+        elif tok == ')' and kind == 'punct' and len(stack) > 0 and stack[-1][0] != None and len(stack[-1][1]) == 0:
+          # head()
+          value = core.Fn(stack.pop()[0])
+        elif kind == 'punct':
+          raise ParseError("unexpected %r in %r" % (tok, text))
+        else:
+          value = self.atom(kind, tok)
+        continue
+
+      if tok == '(' and kind == 'punct':
+        stack.append([value, []])
+        value = None
+        continue
+
+      if len(stack) == 0:
+        raise ParseError("unexpected %r after a complete expression in %r" % (tok, text))
+
+      head, parts = stack[-1]
+      if head == None and len(parts) == 0 and tok != ')':
+        # the operator of an infix application
+        parts.extend([self.atom(kind, tok), value])
+        value = None
+      elif head == None and len(parts) > 0 and tok != ')':
+        # a flattened application repeats the same operator
+        if self.atom(kind, tok) is not parts[0]:
+          raise ParseError("mixed operators %r and %r in %r" % (str(parts[0]), tok, text))
+        parts.append(value)
+        value = None
+      elif head == None and tok == ')':
+        stack.pop()
+        if len(parts) > 0:
+          parts.append(value)
+          value = core.Fn(parts[0], *parts[1:])
+      elif head != None and tok == ',':
+        parts.append(value)
+        value = None
+      elif head != None and tok == ')':
+        stack.pop()
+        parts.append(value)
+        value = core.Fn(head, *parts)
+      else:
+        raise ParseError("unexpected %r in %r" % (tok, text))
+
+    if value == None or len(stack) > 0:
+      raise ParseError("incomplete expression %r" % (text,))
+
+    return value
+
+  def parse_lines(self, lines):
+    '''
+    yields one expression per non-empty line of lines (any iterable of
+    strings, like an open file)
+    '''
+    for line in lines:
+      if line.strip() != '':
+        yield self.parse(line)
+
+def parse(text):
+  '''
+  returns the expression printed in text
+  '''
+  return Parser().parse(text)
+
+def parse_lines(lines):
+  '''
+  yields one expression per non-empty line of lines, lazily
+  '''
+  return Parser().parse_lines(lines)
+
+def load(path):
+  '''
+  returns a list of the expressions in the file at path, one per line
+  '''
+  with open(path) as f:
+    return list(parse_lines(f))
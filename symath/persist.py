@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+'''
+persistent results for memoize.Memoize, kept in a local sqlite database
+
+results are keyed by a fingerprint of the arguments in which expressions are
+replaced by their structural fingerprint (see _Symbolic.fingerprint) and the
+domain flags of their symbols, so they survive restarts and can be shared by
+several processes on the same host.  values are pickled, expressions unpickle
+to the interned instances, a value that can't be read back is a miss
+
+  import symath.persist
+  symath.persist.attach(symath.factor.is_factor, 'symath-cache.db')
+
+or, for new functions:
+
+  @Memoize.Persistent('symath-cache.db')
+  def expensive(exp):
+    ...
+
+arguments that can't be fingerprinted (anything but expressions, numbers,
+strings, booleans, None and tuples or lists of those) and values that can't
+be pickled are just not stored
+'''
+
+import cPickle as pickle
+import hashlib
+import os
+import sqlite3
+import threading
+
+import core
+import memoize
+
+class _Unpersistable(Exception):
+  pass
+
+_DEFAULT_DOMAIN = (False, 0, False)
+
+def _domain_text(exp):
+  # the structural fingerprint leaves out the domain flags of symbols, which
+  # can be changed on live symbols, so add those that aren't the default
+  flags = []
+  for sym in exp.free_symbols:
+    domain = (bool(sym.is_integer), int(sym.is_bitvector), bool(sym.is_bool))
+    if domain != _DEFAULT_DOMAIN:
+      flags.append('%s=%d,%d,%d' % ((sym.fingerprint,) + domain))
+  flags.sort()
+  return ';'.join(flags)
+
+def _key_text(key, out):
+  # explicit stack, arguments can nest tuples of tuples of expressions
+  stack = [key]
+  while len(stack) > 0:
+    k = stack.pop()
+    if isinstance(k, core._Symbolic):
+      out.append('e' + k.fingerprint + _domain_text(k))
+    elif isinstance(k, (tuple, list)):
+      out.append('(%d' % (len(k),))
+      stack.extend(reversed(k))
+    elif k is None or isinstance(k, (bool, int, long, float, str, unicode)):
+      out.append('%s:%r' % (type(k).__name__, k))
+    elif k is memoize._KARGS:
+      out.append('k')
+    else:
+      raise _Unpersistable(k)
+  return out
+
+def key_fingerprint(key):
+  '''
+  returns a hex digest of key that is the same for structurally equal keys,
+  with symbols in the same domains, in every process.  raises TypeError when
+  key can't be fingerprinted
+  '''
+  try:
+    return hashlib.sha1('\0'.join(_key_text(key, []))).hexdigest()
+  except _Unpersistable, e:
+    raise TypeError("can't fingerprint %r" % (e.args[0],))
+
+# guards opening the connections, see SqliteResults.db
+_connect_lock = threading.Lock()
+
+class SqliteResults(object):
+  '''
+  a results store for Memoize backed by the table of cache name in the
+  sqlite database at path
+
+  front is an optional in-process store (a dict, or one of the bounded
+  stores in memoize) checked before the database, so repeated lookups don't
+  go through sqlite and unpickling.  len(), keys(), values() and items() are
+  about the results held in this process, stored() counts the database rows
+
+  the database is opened on first use, once per process: a child forked
+  after that opens its own connection, threads share it under a lock
+  '''
+
+  def __init__(self, path, name, front=None):
+    self.path = path
+    self.name = name
+    self.front = front if front != None else {}
+    self.lock = None
+    self._db = None
+    self._pid = None
+
+  @property
+  def db(self):
+    pid = os.getpid()
+    if self._pid != pid:
+      with _connect_lock:
+        if self._pid != pid:
+          db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+          db.text_factory = str
+          db.execute('PRAGMA journal_mode=WAL')
+          db.execute('PRAGMA synchronous=NORMAL')
+          db.execute('CREATE TABLE IF NOT EXISTS results '
+              '(cache TEXT, key TEXT, value BLOB, PRIMARY KEY (cache, key))')
+          self.lock = threading.Lock()
+          self._db = db
+          self._pid = pid
+    return self._db
+
+  @property
+  def evictions(self):
+    return getattr(self.front, 'evictions', 0)
+
+  def _lookup(self, key):
+    db = self.db
+    with self.lock:
+      row = db.execute('SELECT value FROM results WHERE cache = ? AND key = ?',
+          (self.name, key_fingerprint(key))).fetchone()
+    if row == None:
+      raise KeyError(key)
+    try:
+      return pickle.loads(str(row[0]))
+    except (core.DomainError, pickle.UnpicklingError, EOFError, AttributeError,
+        ImportError, IndexError, ValueError):
+      raise KeyError(key)
+
+  def __getitem__(self, key):
+    try:
+      return self.front[key]
+    except KeyError:
+      pass
+
+    try:
+      rv = self._lookup(key)
+    except TypeError:
+      raise KeyError(key)
+    self.front[key] = rv
+    return rv
+
+  def __setitem__(self, key, value):
+    self.front[key] = value
+    try:
+      fp = key_fingerprint(key)
+      data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    except (TypeError, pickle.PicklingError, RuntimeError):
+      return
+
+    db = self.db
+    with self.lock:
+      db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+          (self.name, fp, sqlite3.Binary(data)))
+
+  def __contains__(self, key):
+    try:
+      self[key]
+      return True
+    except KeyError:
+      return False
+
+  def __len__(self):
+    return len(self.front)
+
+  def stored(self):
+    '''the number of results of this cache in the database'''
+    db = self.db
+    with self.lock:
+      return db.execute('SELECT COUNT(*) FROM results WHERE cache = ?', (self.name,)).fetchone()[0]
+
+  def keys(self):
+    return self.front.keys()
+
+  def values(self):
+    return self.front.values()
+
+  def items(self):
+    return self.front.items()
+
+  def clear(self):
+    '''
+    forgets the results held in this process, the database is left alone,
+    see drop
+    '''
+    self.front.clear()
+
+  def drop(self):
+    '''deletes the results of this cache from the database too'''
+    self.clear()
+    db = self.db
+    with self.lock:
+      db.execute('DELETE FROM results WHERE cache = ?', (self.name,))
+
+  def close(self):
+    if self._pid == os.getpid():
+      self._db.close()
+    self._db = None
+    self._pid = None
+
+def attach(memo, path, name=None):
+  '''
+  makes the Memoize memo keep its results in the database at path as well,
+  its current results store stays in front of the database
+  '''
+  if not isinstance(memo.results, SqliteResults):
+    memo.results = SqliteResults(path, name or memo.name, memo.results)
+  return memo
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+'''
+sparse polynomials, the canonical form of sums, products and powers
+
+a polynomial is a dictionary of monomial => coefficient over generators,
+the subexpressions that aren't +, -, * or a power to a natural number:
+symbols, x | y, f(x), x ** y, (x + y) ** 2...  the generators are sorted in
+canonical order and a monomial is the vector of their exponents, so
+expanding products of sums, collecting like terms and folding constants
+all happen when polynomials are added and multiplied
+
+  p = from_expression((x + 1) * (x - 1))
+  to_expression(p) == -1 + (x ** 2)
+'''
+
+import core
+import stdops
+
+class PolynomialError(Exception):
+  pass
+
+def sort_key(exp):
+  '''
+  the canonical order of expressions, see core._sort_key
+  '''
+  return exp.sort_key
+
+class Polynomial(object):
+  '''
+  terms is a dictionary of monomial => coefficient, a monomial is a tuple of
+  exponents aligned with gens, the generators in canonical order.  terms with
+  a zero coefficient are left out, the constant term is the monomial of zeros
+  '''
+  __slots__ = ('gens', 'terms')
+
+  def __init__(self, gens=(), terms=None):
+    self.gens = tuple(gens)
+    self.terms = terms if terms != None else {}
+
+  @staticmethod
+  def constant(c):
+    if c == 0:
+      return Polynomial()
+    return Polynomial((), {(): c})
+
+  @staticmethod
+  def generator(exp):
+    return Polynomial((exp,), {(1,): 1.0})
+
+  def is_constant(self):
+    return all(sum(m) == 0 for m in self.terms)
+
+  def _align(self, gens):
+    # the same terms over gens, a sorted superset of self.gens
+    if gens == self.gens:
+      return self.terms
+    index = [gens.index(g) for g in self.gens]
+    rv = {}
+    for m, c in self.terms.items():
+      v = [0] * len(gens)
+      for i, e in zip(index, m):
+        v[i] = e
+      rv[tuple(v)] = c
+    return rv
+
+  def _union(self, other):
+    if self.gens == other.gens:
+      return self.gens
+    return tuple(sorted(set(self.gens) | set(other.gens), key=sort_key))
+
+  def __add__(self, other):
+    gens = self._union(other)
+    rv = dict(self._align(gens))
+    for m, c in other._align(gens).items():
+      c = rv.get(m, 0) + c
+      if c == 0:
+        rv.pop(m, None)
+      else:
+        rv[m] = c
+    return Polynomial(gens, rv)
+
+  def __mul__(self, other):
+    gens = self._union(other)
+    a = self._align(gens)
+    b = other._align(gens)
+    rv = {}
+    for ma, ca in a.items():
+      for mb, cb in b.items():
+        m = tuple(x + y for x, y in zip(ma, mb))
+        rv[m] = rv.get(m, 0) + ca * cb
+    return Polynomial(gens, dict((m, c) for m, c in rv.items() if c != 0))
+
+  def scale(self, c):
+    if c == 0:
+      return Polynomial()
+    return Polynomial(self.gens, dict((m, v * c) for m, v in self.terms.items()))
+
+  def __pow__(self, n):
+    rv = Polynomial.constant(1.0)
+    base = self
+    while n > 0:
+      if n & 1:
+        rv = rv * base
+      n >>= 1
+      if n > 0:
+        base = base * base
+    return rv
+
+  def __eq__(self, other):
+    if not isinstance(other, Polynomial):
+      return False
+    gens = self._union(other)
+    return self._align(gens) == other._align(gens)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return 'Polynomial(%s)' % (to_expression(self),)
+
+def _exponent(exp):
+  # the natural number exp stands for, or None
+  if isinstance(exp, core.Number) and exp.n >= 0 and exp.n == int(exp.n):
+    return int(exp.n)
+  return None
+
+def _monomial(p):
+  return len(p.terms) == 1
+
+def _combine(node, parts):
+  '''
+  the polynomial of the arithmetic node, from the polynomials of its
+  arguments
+  '''
+  fn = node.fn
+  if fn is stdops.Add:
+    return reduce(lambda a, b: a + b, parts)
+  elif fn is stdops.Sub:
+    return parts[0] + parts[1].scale(-1.0)
+  elif fn is stdops.Mul:
+    return reduce(lambda a, b: a * b, parts)
+  elif fn is stdops.Div:
+    return parts[0].scale(1.0 / node.args[1].n)
+  else:
+    return parts[0] ** _exponent(node.args[1])
+
+def _arguments(node):
+  '''
+  the arguments of node that are converted too, None when node is a
+  generator
+  '''
+  if not isinstance(node, core.Fn) or len(node.args) < 2:
+    return None
+
+  fn = node.fn
+  if fn is stdops.Add or fn is stdops.Mul:
+    return node.args
+  elif len(node.args) != 2:
+    return None
+  elif fn is stdops.Sub:
+    return node.args
+  elif fn is stdops.Div:
+    # only division by a constant, which is a product
+    d = node.args[1]
+    if isinstance(d, core.Number) and d.n != 0:
+      return node.args[:1]
+  elif fn is stdops.Pow and _exponent(node.args[1]) != None:
+    return node.args[:1]
+  return None
+
+def from_expression(exp, cache=None):
+  '''
+  returns the Polynomial of exp
+
+  cache, if given, is a mapping of expressions to their polynomials, it is
+  looked at and filled for every subexpression that is converted
+  '''
+  exp = core.symbolic(exp)
+  if cache is None:
+    cache = {}
+
+  # keyed by id(), every node on the stack is kept alive by exp
+  done = {}
+  stack = [exp]
+  while len(stack) > 0:
+    node = stack[-1]
+    if id(node) in done:
+      stack.pop()
+      continue
+
+    rv = cache.get(node)
+    if rv is not None:
+      done[id(node)] = rv
+      stack.pop()
+      continue
+
+    args = _arguments(node)
+    if args == None:
+      if isinstance(node, core.Number):
+        rv = Polynomial.constant(node.n)
+      else:
+        rv = Polynomial.generator(node)
+    else:
+      pending = [a for a in args if id(a) not in done]
+      if len(pending) > 0:
+        stack.extend(pending)
+        continue
+      if node.fn is stdops.Pow and not _monomial(done[id(args[0])]):
+        # a power of a sum stays a power, it isn't expanded
+        rv = Polynomial.generator(node)
+      else:
+        rv = _combine(node, [done[id(a)] for a in args])
+
+    stack.pop()
+    done[id(node)] = rv
+    cache[node] = rv
+
+  return done[id(exp)]
+
+def _term(gens, m, c):
+  factors = []
+  for g, e in zip(gens, m):
+    if e == 1:
+      factors.append(g)
+    elif e > 1:
+      factors.append(core.Fn(stdops.Pow, g, core.symbolic(e)))
+
+  if len(factors) == 0:
+    return core.symbolic(c)
+  factors.sort(key=sort_key)
+  if c != 1:
+    factors.insert(0, core.symbolic(c))
+  return _nary(stdops.Mul, factors)
+
+def _nary(fn, args):
+  if len(args) == 1:
+    return args[0]
+  return core.Fn(fn, *args)
+
+def to_expression(p):
+  '''
+  returns the expression of the Polynomial p, a sum of products of a
+  coefficient and powers of the generators, both flattened and sorted in
+  canonical order
+  '''
+  if not isinstance(p, Polynomial):
+    raise PolynomialError('not a polynomial: %r' % (p,))
+
+  if len(p.terms) == 0:
+    return core.symbolic(0)
+
+  terms = [_term(p.gens, m, c) for m, c in p.terms.items()]
+  terms.sort(key=sort_key)
+  return _nary(stdops.Add, terms)
+
+def expand(exp, cache=None):
+  '''
+  returns exp with products of sums expanded, like terms collected and
+  constants folded
+  '''
+  return to_expression(from_expression(exp, cache))
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+'''
+rewriting with sets of rules, the engine behind core.replace
+
+the rules are indexed by the head and arity of their pattern, so a subterm
+only tries the rules that could possibly match it: a rule for f(a, b) is never
+tried on g(x, y) or on f(x).  patterns whose head is a wild are kept by
+arity, a lone wild matches everything.  a flattened application of an
+associative and commutative operator, x + y + z, also tries the rules for
+fewer operands, see match.Pattern
+
+rewriting to a normal form is outermost first: rules are applied at a node
+until none matches, then its arguments are normalized, and the node is
+looked at again only if one of them changed.  normal forms are remembered for
+the duration of a call, so subterms that are shared, or that a rule just moved
+around without changing, are never rewritten twice
+'''
+
+import core
+import match
+import substitution
+
+class Rule(object):
+  '''
+  a pattern and its replacement, the wilds of the pattern are substituted in
+  the replacement
+  '''
+
+  def __init__(self, pattern, replacement, order=0):
+    self.pattern = match.compile(pattern)
+    self.replacement = core.symbolic(replacement)
+    self.order = order
+    self.wilds = tuple(core.Wild(name) for name in self.pattern.names)
+    self.key = _pattern_key(pattern)
+
+  def apply(self, exp):
+    '''
+    returns exp rewritten by the rule, or None if the rule doesn't match
+    '''
+    m = self.pattern.bind(exp)
+    if m == None:
+      return None
+    return substitution.substitute(self.replacement, dict(zip(self.wilds, m)))
+
+  def __repr__(self):
+    return 'Rule(%s => %s)' % (self.pattern, self.replacement)
+
+def _key(exp):
+  if isinstance(exp, core.Fn) and len(exp.args) > 0:
+    return (exp.fn, len(exp.args))
+  return (exp, -1)
+
+def _pattern_key(pattern):
+  '''
+  the index key of the subterms pattern can match, None for any subterm
+  '''
+  if isinstance(pattern, core.Wild):
+    return None
+  elif isinstance(pattern, core.Fn) and len(pattern.args) > 0 and pattern.fn.has_wilds:
+    return (None, len(pattern.args))
+  return _key(pattern)
+
+class RuleIndex(object):
+  '''
+  a set of rules indexed by the head and arity of their patterns
+
+  rules is a sequence of (pattern, replacement) pairs, earlier rules are
+  tried first, or a dictionary of pattern => replacement, whose rules are
+  tried in the canonical order of their patterns (see _Symbolic.sort_key)
+  '''
+
+  def __init__(self, rules):
+    if isinstance(rules, dict):
+      rules = sorted(rules.items(), key=lambda r: core.symbolic(r[0]).sort_key)
+
+    self.rules = [Rule(p, r, i) for i, (p, r) in enumerate(rules)]
+    self.buckets = {}
+    for r in self.rules:
+      self.buckets.setdefault(r.key, []).append(r)
+    self._candidates = {}
+
+  def candidates(self, exp):
+    '''
+    returns the rules that could match exp, in order
+    '''
+    key = _key(exp)
+    try:
+      return self._candidates[key]
+    except KeyError:
+      pass
+
+    rv = self.buckets.get(key, []) + self.buckets.get(None, [])
+    if key[1] >= 0:
+      rv += self.buckets.get((None, key[1]), [])
+    if key[1] > 2 and match._is_ac(key[0]):
+      for n in range(2, key[1]):
+        rv += self.buckets.get((key[0], n), [])
+    rv = tuple(sorted(rv, key=lambda r: r.order))
+    self._candidates[key] = rv
+    return rv
+
+  def rewrite_top(self, exp):
+    '''
+    applies rules at the top of exp until none of them matches anymore, or
+    until they come back to a node they already rewrote, h(a, b) => h(b, a)
+    stops at h(x, y)
+    '''
+    seen = set([exp])
+    while True:
+      for rule in self.candidates(exp):
+        rv = rule.apply(exp)
+        if rv is not None and rv is not exp:
+          if rv in seen:
+            return rv
+          seen.add(rv)
+          exp = rv
+          break
+      else:
+        return exp
+
+  def normalize(self, exp):
+    '''
+    rewrites exp until no rule matches any of its subterms
+
+    like rewrite_top, rules that come back to a node that is still being
+    rewritten stop there, whether they go around at the top or through the
+    arguments: f(a) => g(h(a)) with g(k(a)) => g(h(a)) and h(a) => k(a)
+    stops at g(h(x))
+    '''
+    done = {}
+    # what a node rewrites to in one step, at the top or in its arguments
+    step = {}
+    top_normal = set()
+    # the nodes on the stack whose rewriting has started but isn't done
+    active = set()
+    # every node whose id is a key above
+    keep = []
+    stack = [exp]
+
+    while len(stack) > 0:
+      node = stack[-1]
+      if id(node) in done:
+        stack.pop()
+        continue
+      active.add(id(node))
+
+      if id(node) not in step:
+        if id(node) not in top_normal:
+          nxt = self.rewrite_top(node)
+          if nxt is node:
+            top_normal.add(id(node))
+
+        if id(node) in top_normal:
+          if isinstance(node, core.Fn):
+            pending = [a for a in node.args if id(a) not in done and id(a) not in active]
+            if len(pending) > 0:
+              pending.reverse()
+              stack.extend(pending)
+              continue
+            nxt = _rebuild(node, [done.get(id(a), a) for a in node.args])
+          else:
+            nxt = node
+
+        step[id(node)] = nxt
+        keep.append(node)
+
+      nxt = step[id(node)]
+      if nxt is node or id(nxt) in active:
+        done[id(node)] = nxt
+      elif id(nxt) in done:
+        done[id(node)] = done[id(nxt)]
+      else:
+        stack.append(nxt)
+        continue
+
+      active.discard(id(node))
+      stack.pop()
+
+    return done[id(exp)]
+
+  def rewrite_once(self, exp):
+    '''
+    a single pass from the top down: at every node the rules are tried once
+    each, in order, then the arguments of the result are rewritten
+    '''
+    done = {}
+    tops = {}
+    stack = [exp]
+
+    while len(stack) > 0:
+      node = stack[-1]
+      if id(node) in done:
+        stack.pop()
+        continue
+
+      if id(node) not in tops:
+        # every rule gets one try, the candidates change with the top
+        top = node
+        last = -1
+        while True:
+          for rule in self.candidates(top):
+            if rule.order > last:
+              last = rule.order
+              rv = rule.apply(top)
+              if rv is not None:
+                top = rv
+                break
+          else:
+            break
+        tops[id(node)] = (node, top)
+
+      top = tops[id(node)][1]
+      if not isinstance(top, core.Fn):
+        done[id(node)] = top
+        stack.pop()
+        continue
+
+      pending = [a for a in top.args if id(a) not in done]
+      if len(pending) > 0:
+        pending.reverse()
+        stack.extend(pending)
+        continue
+
+      stack.pop()
+      done[id(node)] = _rebuild(top, [done[id(a)] for a in top.args])
+
+    return done[id(exp)]
+
+  def rewrite(self, exp, repeat=True):
+    if repeat:
+      return self.normalize(exp)
+    return self.rewrite_once(exp)
+
+def _rebuild(node, args):
+  for i in range(len(args)):
+    if args[i] is not node.args[i]:
+      return core.Fn(node.fn, *args)
+  return node
+
+def replace(exp, rules, repeat=True):
+  '''
+  rewrites exp with rules (a RuleIndex, a dictionary of pattern =>
+  replacement or a sequence of pairs), to a normal form unless repeat is
+  False, in which case a single pass is made
+  '''
+  if not isinstance(rules, RuleIndex):
+    rules = RuleIndex(rules)
+  return rules.rewrite(exp, repeat)
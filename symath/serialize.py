@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+'''
+compact binary serialization of expressions
+
+every distinct node is written once, so shared subterms stay shared.  the
+file is a header followed by flat little endian arrays:
+
+  kinds          one byte per node (see the _KIND_ constants)
+  payload        per node: index into numbers, the symbol or operator
+                 tables, the value of a boolean, or for a function
+                 application the position of its first child in children
+  arity          per node: number of children (head + arguments)
+  children       node indices of heads and arguments
+  roots          node indices of the expressions that were dumped
+  numbers        float64 values of the Numbers
+  sym_*          the symbol table: name, kargs (json), and domain flags
+  op_name        the operator table: names of the stdops operators used
+  str_*          the string table: offsets and utf-8 data
+
+nodes are written children first, so loading is a single forward pass that
+re-interns every node through the core constructors.  MappedExpressions
+reads a file through mmap and only builds the expressions asked for
+'''
+
+import array
+import json
+import mmap
+import struct
+import sys
+import weakref
+
+import core
+import stdops
+
+class SerializationError(Exception):
+  pass
+
+_MAGIC = 'SYMB'
+_VERSION = 1
+
+_KIND_NUMBER = 0
+_KIND_BOOLEAN = 1
+_KIND_SYMBOL = 2
+_KIND_WILD = 3
+_KIND_FN = 4
+_KIND_OPERATOR = 5
+
+_NONE = 0xffffffff
+
+# (name, array typecode)
+_SECTIONS = (
+    ('kinds', 'B'),
+    ('payload', 'I'),
+    ('arity', 'I'),
+    ('children', 'I'),
+    ('roots', 'I'),
+    ('numbers', 'd'),
+    ('sym_name', 'I'),
+    ('sym_kargs', 'I'),
+    ('sym_integer', 'I'),
+    ('sym_bitvector', 'I'),
+    ('sym_bool', 'I'),
+    ('op_name', 'I'),
+    ('str_offsets', 'I'),
+    ('str_data', 'c')
+    )
+
+_HEADER = struct.Struct('<4sII')
+_SECTION = struct.Struct('<QQ')
+
+def _operators():
+  return dict((k, v) for k, v in vars(stdops).items() if isinstance(v, core.Symbol))
+
+class _Writer(object):
+
+  def __init__(self):
+    self.sections = dict((name, array.array(code)) for name, code in _SECTIONS)
+    self.nodes = {}
+    self.strings = {}
+    self.symbols = {}
+    self.operators = {}
+    self.opnames = dict((v, k) for k, v in _operators().items())
+
+  def string(self, s):
+    if s not in self.strings:
+      self.strings[s] = len(self.strings)
+      data = s.encode('utf-8')
+      offsets = self.sections['str_offsets']
+      if len(offsets) == 0:
+        offsets.append(0)
+      self.sections['str_data'].fromstring(data)
+      offsets.append(offsets[-1] + len(data))
+    return self.strings[s]
+
+  def symbol(self, sym):
+    if sym not in self.symbols:
+      if len(sym.kargs) > 0:
+        try:
+          kargs = self.string(json.dumps(sym.kargs, sort_keys=True))
+        except TypeError:
+          raise SerializationError("can't serialize the kargs of %s" % (sym,))
+      else:
+        kargs = _NONE
+
+      self.symbols[sym] = len(self.symbols)
+      self.sections['sym_name'].append(self.string(sym.name))
+      self.sections['sym_kargs'].append(kargs)
+      self.sections['sym_integer'].append(int(getattr(sym, 'is_integer', False)))
+      self.sections['sym_bitvector'].append(getattr(sym, 'is_bitvector', 0))
+      self.sections['sym_bool'].append(int(getattr(sym, 'is_bool', False)))
+    return self.symbols[sym]
+
+  def operator(self, sym):
+    if sym not in self.operators:
+      self.operators[sym] = len(self.operators)
+      self.sections['op_name'].append(self.string(self.opnames[sym]))
+    return self.operators[sym]
+
+  def leaf(self, node):
+    if isinstance(node, core.Number):
+      self.sections['numbers'].append(node.n)
+      return _KIND_NUMBER, len(self.sections['numbers']) - 1
+    elif isinstance(node, core.Boolean):
+      return _KIND_BOOLEAN, int(bool(node.boolean))
+    elif isinstance(node, core.Symbol) and node in self.opnames:
+      return _KIND_OPERATOR, self.operator(node)
+    elif isinstance(node, core.Symbol):
+      return _KIND_SYMBOL, self.symbol(node)
+    elif isinstance(node, core.Wild):
+      return _KIND_WILD, self.symbol(node)
+    else:
+      raise SerializationError("can't serialize %s (type: %s)" % (node, type(node)))
+
+  def add(self, exp):
+    s = self.sections
+    stack = [exp]
+    while len(stack) > 0:
+      node = stack[-1]
+      if id(node) in self.nodes:
+        stack.pop()
+        continue
+
+      children = [node.fn] + list(node.args) if isinstance(node, core.Fn) else []
+      pending = [c for c in children if id(c) not in self.nodes]
+      if len(pending) > 0:
+        pending.reverse()
+        stack.extend(pending)
+        continue
+
+      stack.pop()
+      if len(children) > 0:
+        kind, payload = _KIND_FN, len(s['children'])
+        s['children'].extend(self.nodes[id(c)][0] for c in children)
+      else:
+        kind, payload = self.leaf(node)
+
+      # keep node alive so its id isn't reused while we are writing
+      self.nodes[id(node)] = (len(s['kinds']), node)
+      s['kinds'].append(kind)
+      s['payload'].append(payload)
+      s['arity'].append(len(children))
+
+    s['roots'].append(self.nodes[id(exp)][0])
+
+  def write(self, f):
+    f.write(_HEADER.pack(_MAGIC, _VERSION, len(_SECTIONS)))
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    for name, code in _SECTIONS:
+      a = self.sections[name]
+      f.write(_SECTION.pack(offset, len(a)))
+      offset += len(a) * a.itemsize
+
+    for name, code in _SECTIONS:
+      a = self.sections[name]
+      if sys.byteorder == 'big' and a.itemsize > 1:
+        a = array.array(code, a)
+        a.byteswap()
+      f.write(a.tostring())
+
+def dump(exps, f):
+  '''
+  writes the expressions in exps to the file-like object f
+  '''
+  w = _Writer()
+  for exp in exps:
+    w.add(exp)
+  w.write(f)
+
+def dumps(exps):
+  '''
+  returns the expressions in exps serialized as a string
+  '''
+  import StringIO
+  f = StringIO.StringIO()
+  dump(exps, f)
+  return f.getvalue()
+
+class _MappedSection(object):
+  '''
+  reads the items of a section straight out of a buffer
+  '''
+
+  def __init__(self, buf, offset, length, code):
+    self.buf = buf
+    self.offset = offset
+    self.length = length
+    self.item = struct.Struct('<' + code)
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, i):
+    if i < 0 or i >= self.length:
+      raise IndexError(i)
+    return self.item.unpack_from(self.buf, self.offset + i * self.item.size)[0]
+
+class _Reader(object):
+
+  def __init__(self, buf, lazy):
+    magic, version, count = _HEADER.unpack_from(buf, 0)
+    if magic != _MAGIC or version != _VERSION or count != len(_SECTIONS):
+      raise SerializationError("not a symath expression file")
+
+    self.buf = buf
+    self.sections = {}
+    for i in range(count):
+      name, code = _SECTIONS[i]
+      offset, length = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+      if name == 'str_data':
+        self.str_data = offset
+      elif lazy:
+        self.sections[name] = _MappedSection(buf, offset, length, code)
+      else:
+        a = array.array(code)
+        a.fromstring(buf[offset:offset + length * a.itemsize])
+        if sys.byteorder == 'big':
+          a.byteswap()
+        self.sections[name] = a
+
+    self.operators = _operators()
+    self.leaves = {}
+    self.nodes = weakref.WeakValueDictionary() if lazy else {}
+
+  def string(self, i):
+    offsets = self.sections['str_offsets']
+    start = self.str_data + offsets[i]
+    return self.buf[start:self.str_data + offsets[i + 1]].decode('utf-8')
+
+  def symbol(self, typ, i):
+    s = self.sections
+    name = str(self.string(s['sym_name'][i]))
+    kargs = {}
+    if s['sym_kargs'][i] != _NONE:
+      kargs = dict((str(k), v) for k, v in json.loads(self.string(s['sym_kargs'][i])).items())
+
+    if typ != core.Symbol:
+      return typ(name, **kargs)
+
+    domain = (s['sym_integer'][i], s['sym_bitvector'][i], s['sym_bool'][i])
+    try:
+      return core._domain_symbol(typ, name, kargs, domain)
+    except core.DomainError as e:
+      raise SerializationError(str(e))
+
+  def leaf(self, kind, payload):
+    s = self.sections
+    if (kind, payload) not in self.leaves:
+      if kind == _KIND_NUMBER:
+        rv = core.Number(s['numbers'][payload])
+      elif kind == _KIND_BOOLEAN:
+        rv = core.Boolean(bool(payload))
+      elif kind == _KIND_OPERATOR:
+        rv = self.operators[str(self.string(s['op_name'][payload]))]
+      elif kind == _KIND_SYMBOL:
+        rv = self.symbol(core.Symbol, payload)
+      elif kind == _KIND_WILD:
+        rv = self.symbol(core.Wild, payload)
+      else:
+        raise SerializationError("unknown node kind %d" % (kind,))
+      self.leaves[(kind, payload)] = rv
+    return self.leaves[(kind, payload)]
+
+  def children(self, i):
+    s = self.sections
+    start = s['payload'][i]
+    return [s['children'][j] for j in range(start, start + s['arity'][i])]
+
+  def node(self, index):
+    '''
+    builds node index, and whatever it needs that hasn't been built yet
+    '''
+    s = self.sections
+
+    # hold on to what we build until the root is done, the cache is weak
+    built = {}
+    stack = [index]
+    while len(stack) > 0:
+      i = stack[-1]
+      if i in built:
+        stack.pop()
+        continue
+
+      if i in self.nodes:
+        built[i] = self.nodes[i]
+        stack.pop()
+        continue
+
+      kind = s['kinds'][i]
+      if kind != _KIND_FN:
+        built[i] = self.leaf(kind, s['payload'][i])
+        self.nodes[i] = built[i]
+        stack.pop()
+        continue
+
+      children = self.children(i)
+      pending = [c for c in children if c not in built]
+      if len(pending) > 0:
+        stack.extend(pending)
+        continue
+
+      children = [built[c] for c in children]
+      built[i] = core.Fn(*children)
+      self.nodes[i] = built[i]
+      stack.pop()
+
+    return built[index]
+
+  def roots(self):
+    return [self.node(i) for i in self.sections['roots']]
+
+def loads(data):
+  '''
+  returns the list of expressions serialized in the string data
+  '''
+  return _Reader(data, False).roots()
+
+def load(f):
+  '''
+  returns the list of expressions serialized in the file-like object f
+  '''
+  return loads(f.read())
+
+class MappedExpressions(object):
+  '''
+  a read-only sequence of the expressions in a file, the file is memory
+  mapped and each expression is only built when it is indexed
+
+  subterms that have been built are reused for as long as they are alive
+  '''
+
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self._reader = _Reader(self._map, True)
+
+  def __len__(self):
+    return len(self._reader.sections['roots'])
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += len(self)
+    return self._reader.node(self._reader.sections['roots'][i])
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def close(self):
+    self._map.close()
@@ -1,264 +1,374 @@
 #!/usr/bin/env python
-import threading
 import stdops as stdops
 import core
-import copy
 import operator
 import factor
+import match
+import memoize
+import polynomial
 
-from core import wild
+# the rules below match against patterns compiled once, Pattern.bind returns
+# the values of the wilds sorted by name.  rules on commutative operators use
+# AC patterns, so they don't depend on the order of the operands
+_a, _b, _c = core.wilds('a b c')
+_binary = match.compile(_a(_b, _c))
 
-def _order(a,b):
-  '''
-  used internally to put shit in canonical order
-  '''
-  if isinstance(a, core.Number):
-    if(isinstance(b, core.Number)):
-      return -1 if a.n < b.n else (0 if a.n == b.n else 1)
-    return -1
-  elif isinstance(b, core.Number):
-    return 1
-  elif isinstance(a, core.Symbol):
-    if(isinstance(b, core.Symbol)):
-      return -1 if a.name < b.name else (0 if a.name == b.name else 1)
-    return -1
-  elif isinstance(b, core.Symbol):
-    return 1
+# associative and commutative operators are kept flattened by normalize, as
+# one application to all of their operands sorted in canonical order
 
-  else:
-    return -1 if str(a) < str(b) else (0 if str(a) == str(b) else 1)
+def _is_nary(exp):
+  return isinstance(exp, core.Fn) and len(exp.args) > 2
 
-def _assoc_reorder(exp):
-  if len(exp) == 1:
-    return exp
-
-  # canonicalize the arguments first
-  args = list(map(lambda x: _assoc_reorder(x), exp.args))
-  if tuple(args) != tuple(exp.args):
-    exp = core.Fn(exp.fn, *args)
+def _nary(fn, args):
+  if len(args) == 1:
+    return args[0]
+  return core.Fn(fn, *args)
 
-  # if it's associative and one of the arguments is another instance of the
-  # same function, canonicalize the order
-  if len(exp.args) == 2 and 'associative' in exp.kargs and exp.kargs['associative']:
-    args = exp._get_assoc_arguments()
-    oldargs = tuple(args)
-    args.sort(_order)
-    if tuple(args) != oldargs:
-      kargs = copy.copy(exp.kargs)
-      exp = reduce(lambda a, b: exp.fn(a,b), args)
-
-  return exp
-
-def _remove_subtractions(exp):
-  a,b = core.wilds('a b')
-  vals = {}
-  if exp.match(stdops.Sub(a,b), vals):
-    return vals['a'] + (-vals['b'])
-  else:
-    return exp
-
-def _strip_identities_pass(exp):
-  a,b,c = core.wilds('a b c')
-  vals = {}
-
-  if exp.match(a(b, c)):
-    kargs = exp[0].kargs
-    lidentity = kargs['lidentity'] if 'lidentity' in kargs else kargs['identity'] if 'identity' in kargs else None
-    ridentity = kargs['ridentity'] if 'ridentity' in kargs else kargs['identity'] if 'identity' in kargs else None
-    
-    if lidentity != None and exp.match(a(lidentity, b), vals):
-      return vals['b'].walk(_strip_identities)
-    elif ridentity != None and exp.match(a(b, ridentity), vals):
-      return vals['b'].walk(_strip_identities)
-
-  return exp
-
-def _strip_identities(exp):
-  rv = exp.walk(_strip_identities_pass)
-  while rv != exp:
-    exp = rv
-    rv = exp.walk(_strip_identities_pass)
-
-  return rv
+def _sort_key(exp):
+  return exp.sort_key
 
 def _zero_terms(exp):
   if hasattr(exp[0],'kargs') and 'zero' in exp[0].kargs:
+    zero = exp[0].kargs['zero']
     for i in range(1, len(exp)):
-      if exp[1] == exp[0].kargs['zero'] or exp[2] == exp[0].kargs['zero']:
-        return exp[0].kargs['zero']
+      if exp[i] == zero:
+        return zero
   return exp
 
 def _distribute(op1, op2):
+  ac = 'commutative' in op1.kargs
+  left = match.compile(op1(op2(_a, _b), _c), ac=ac)
+  right = None if ac else match.compile(op1(_a, op2(_b, _c)))
+
   def _(exp):
-    a,b,c = core.wilds('a b c')
-    vals = {}
+    m = left.bind(exp)
+    if m != None:
+      a, b, c = m
+      return op2(op1(c, a), op1(c, b))
 
-    if exp.match(op1(op2(a, b), c), vals):
-      return op2(op1(vals['c'], vals['a']), op1(vals['c'], vals['b']))
-    elif exp.match(op1(a, op2(b, c)), vals):
-      return op2(op1(vals['a'], vals['b']), op1(vals['a'], vals['c']))
-    else:
-      return exp
+    m = right.bind(exp) if right != None else None
+    if m != None:
+      a, b, c = m
+      return op2(op1(a, b), op1(a, c))
+
+    return exp
 
   return _
 
-def _simplify_mul_div(exp):
-  a,b,c = core.wilds('a b c')
-  vals = core.WildResults()
+_distribute_bitand = _distribute(stdops.BitAnd, stdops.BitOr)
+_cancel_div = match.compile(_c * (_b / _c), ac=True)
+_mul_div = match.compile(_a * (_b / _c), ac=True)
+_div = match.compile(_a / _b)
 
-  if exp.match(c * (b / c), vals) or exp.match((b / c) * c, vals):
-    return vals.b
+def _simplify_mul_div(exp):
+  m = _cancel_div.bind(exp)
+  if m != None:
+    return m[0]
+
+  m = _mul_div.bind(exp)
+  if m != None:
+    a, b, c = m
+    return (a * b) / c
+
+  m = _div.bind(exp)
+  if m != None:
+    a, b = m
+    if isinstance(b, core.Number):
+      return a * (1.0 / b.value())
+    elif factor.is_factor(b, a):
+      return factor.get_coefficient(a, b)
 
-  if exp.match(a * (b / c), vals) or exp.match((b / c) * a, vals):
-    return (vals.a * vals.b) / vals.c
+  return exp
 
-  elif exp.match(a / b, vals) and isinstance(vals.b, core.Number):
-    return vals.a * (1.0 / vals.b.value())
+def _fold_known_values(exp):
+  # the known operands of a flattened application fold into one
+  if not _is_nary(exp) or 'numeric' not in exp.kargs:
+    return exp
 
-  elif exp.match(a / b, vals) and factor.is_factor(vals.b, vals.a):
-    return factor.get_coefficient(vals.a, vals.b)
+  known = [a for a in exp.args if isinstance(a, core._KnownValue)]
+  if len(known) < 2:
+    return exp
 
-  return exp
+  cast = exp.kargs['cast'] if 'cast' in exp.kargs else (lambda x: x)
+  nfn = getattr(operator, exp.kargs['numeric'])
+  value = reduce(lambda a, b: nfn(cast(a), cast(b)), [k.value() for k in known])
+  rest = [a for a in exp.args if not isinstance(a, core._KnownValue)]
+  return _nary(exp.fn, [core.symbolic(value)] + rest)
 
 def _simplify_known_values(exp):
-  a,b,c = core.wilds('a b c')
-  vals = {}
-  if exp.match(a(b,c), vals) \
-      and 'numeric' in vals['a'].kargs \
-      and isinstance(vals['b'], core._KnownValue) \
-      and isinstance(vals['c'], core._KnownValue):
-    cast = vals['a'].kargs['cast'] if 'cast' in vals['a'].kargs else (lambda x: x)
-    nfn = getattr(operator, vals['a'].kargs['numeric'])
-    return core.symbolic(nfn(cast(vals['b'].value()), cast(vals['c'].value())))
+  m = _binary.bind(exp)
+  if m == None:
+    return _fold_known_values(exp)
+
+  fn, b, c = m
+  if 'numeric' in fn.kargs \
+      and isinstance(b, core._KnownValue) \
+      and isinstance(c, core._KnownValue):
+    cast = fn.kargs['cast'] if 'cast' in fn.kargs else (lambda x: x)
+    nfn = getattr(operator, fn.kargs['numeric'])
+    return core.symbolic(nfn(cast(b.value()), cast(c.value())))
   else:
     return exp
 
-def _get_factors(exp):
-  rv = {}
-  a,b = core.wilds('a b')
-  vals = {}
-
-  if exp.match(a * b, vals):
-    tmp = _get_factors(vals['a'])
-    for i in tmp:
-      if i in rv:
-        rv[i] += tmp[i] 
-      else:
-        rv[i] = tmp[i]
-    tmp = _get_factors(vals['b'])
-    for i in tmp:
-      if i in rv:
-        rv[i] += tmp[i] 
-      else:
-        rv[i] = tmp[i]
-  elif exp.match(a ** b, vals):
-    rv = _get_factors(vals['a'])
-    for k in rv:
-      rv[k] = rv[k] * vals['b']
-  else:
-    rv[exp] = 1
+def _args(exp):
+  return list(map(lambda x: exp[x], range(1, len(exp))))
+
+_xor_self = match.compile(_a ^ _a)
+_idempotent = (match.compile(_a | _a), match.compile(_a & _a))
+_shift_back = (match.compile((_a << _b) >> _b), match.compile((_a >> _b) << _b))
 
+def _unique(args):
+  rv = []
+  for a in args:
+    if not any(a is b for b in rv):
+      rv.append(a)
   return rv
 
-def _fold_additions(exp):
-  a,b,c = core.wilds('a b c')
-  vals = {}
+def _simplify_bitops(exp):
+  if _xor_self.bind(exp) != None:
+    return core.symbolic(0)
 
-  if exp.match(a + a, vals):
-    return vals['a'] * 2
+  if _is_nary(exp) and (exp.fn is stdops.BitAnd or exp.fn is stdops.BitOr):
+    args = _unique(exp.args)
+    if len(args) < len(exp.args):
+      return _nary(exp.fn, args)
 
-  elif exp.match(a + (a * b), vals) or exp.match(a + (b * a), vals):
-    return (vals['b'] + 1) * vals['a']
+  for p in _idempotent + _shift_back:
+    m = p.bind(exp)
+    if m != None:
+      return m[0]
 
-  else:
-    return exp
+  return exp
 
-def _convert_to_pow(exp):
-  a,b,c = core.wilds('a b c')
+class _Results(memoize.LRUResults):
+  '''
+  a bounded store of node => result that counts its hits and misses
+  '''
 
-  if not exp.match(a(b,c)):
-    return exp
+  def __init__(self, maxsize):
+    self.hits = 0
+    self.misses = 0
+    memoize.LRUResults.__init__(self, maxsize)
+
+  def get(self, key, default=None):
+    try:
+      rv = self[key]
+    except KeyError:
+      self.misses += 1
+      return default
+    self.hits += 1
+    return rv
+
+  def stats(self):
+    return {'size': len(self), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+# normal forms, and the polynomials of the arithmetic subterms
+CACHE_SIZE = 65536
+_caches = {
+    'normalize': _Results(CACHE_SIZE),
+    'polynomial': _Results(CACHE_SIZE),
+    }
+
+def cache_stats():
+  '''
+  returns the size, hits, misses and evictions of the caches of simplify
+  '''
+  return dict((k, v.stats()) for k, v in _caches.items())
 
-  fs = _get_factors(exp)
-  rv = 1
-  for k in fs:
-    if fs[k] == 1:
-      rv = rv * k
-    else:
-      rv = rv * (k ** fs[k])
-  return rv
+def clear_cache():
+  for v in _caches.values():
+    v.clear()
+    v.hits = 0
+    v.misses = 0
+    v.evictions = 0
 
-def _args(exp):
-  return list(map(lambda x: exp[x], range(1, len(exp))))
+def simplify(exp):
+  '''
+  attempts to simplify an expression
+  is knowledgeable of the operations defined in symath.stdops
 
-def _simplify_bitops(exp):
-  a,b = core.wilds('a b')
-  vals = core.WildResults()
+  see normalize, results are cached, see cache_stats
+  '''
+  return normalize(exp)
 
-  if exp.match(a ^ a):
-    return core.symbolic(0)
-  elif exp.match(a | a, vals):
-    return vals.a
-  elif exp.match(a & a, vals):
-    return vals.a
-  elif exp.match((a << b) >> b, vals) or exp.match((a >> b) << b, vals):
-    return vals.a
-  else:
+# the rules only look at the top of a node, its arguments are normal
+# already.  what they build is normalized in turn, see normalize
+
+def _strip_top(exp):
+  if _is_nary(exp) and 'identity' in exp.kargs:
+    identity = core.symbolic(exp.kargs['identity'])
+    args = [a for a in exp.args if a is not identity]
+    if len(args) < len(exp.args):
+      return _nary(exp.fn, args) if len(args) > 0 else identity
     return exp
 
-def _commutative_reorder(exp):
-  oexp = exp
+  m = _binary.bind(exp)
+
+  if m != None:
+    fn, lhs, rhs = m
+    kargs = fn.kargs
+    lidentity = kargs['lidentity'] if 'lidentity' in kargs else kargs['identity'] if 'identity' in kargs else None
+    ridentity = kargs['ridentity'] if 'ridentity' in kargs else kargs['identity'] if 'identity' in kargs else None
+
+    if lidentity != None and lhs is core.symbolic(lidentity):
+      return rhs
+    elif ridentity != None and rhs is core.symbolic(ridentity):
+      return lhs
+
+  return exp
+
+def _reorder_top(exp):
   if len(exp) > 1 and 'commutative' in exp[0].kargs:
-    args = list(map(lambda x: x.walk(_commutative_reorder), _args(exp)))
-    args.sort(cmp=_order)
+    args = _args(exp)
+    args.sort(key=_sort_key)
     exp = exp[0](*args)
   return exp
 
-def _simplify_pass(exp):
-  exp = exp.walk(\
-    _commutative_reorder, \
-    _strip_identities, \
-    _simplify_mul_div, \
-    _strip_identities, \
-    _simplify_known_values, \
-    _strip_identities, \
-    _convert_to_pow, \
-    _strip_identities, \
-    _remove_subtractions, \
-    _strip_identities, \
-    _distribute(stdops.BitAnd, stdops.BitOr), \
-    _strip_identities, \
-    _distribute(stdops.Mul, stdops.Add), \
-    _strip_identities, \
-    _fold_additions, \
-    _strip_identities, \
-    _zero_terms, \
-    _strip_identities, \
-    _commutative_reorder, \
-    _strip_identities, \
-    _distribute(stdops.BitAnd, stdops.BitOr), \
-    _strip_identities, \
-    _distribute(stdops.Mul, stdops.Add), \
-    _strip_identities, \
-    _assoc_reorder, \
-    _strip_identities, \
-    _simplify_bitops, \
-    _strip_identities, \
-    _simplify_mul_div, \
-    _strip_identities \
-    )
-
-  return exp.walk(_strip_identities)
+def _is_canonical(exp):
+  # flattened, with the operands sorted
+  args = exp.args
+  for i in range(len(args)):
+    if isinstance(args[i], core.Fn) and args[i].fn is exp.fn:
+      return False
+    if i > 0 and args[i - 1].sort_key > args[i].sort_key:
+      return False
+  return True
+
+def _assoc_top(exp):
+  if len(exp) == 1:
+    return exp
 
-def simplify(exp):
-  '''
-  attempts to simplify an expression
-  is knowledgeable of the operations defined in symath.stdops
-  '''
-  sexp = _simplify_pass(exp)
-  while sexp != exp:
-    #print '%s => %s' % (exp, sexp)
-    exp = sexp
-    sexp = _simplify_pass(exp)
+  if match._is_ac(exp.fn):
+    if _is_canonical(exp):
+      return exp
+    args = match._operands(exp.fn, exp)
+    args.sort(key=_sort_key)
+    return _nary(exp.fn, args)
+
+  if len(exp.args) == 2 and 'associative' in exp.kargs and exp.kargs['associative']:
+    args = exp._get_assoc_arguments()
+    oldargs = tuple(args)
+    args.sort(key=_sort_key)
+    if tuple(args) != oldargs:
+      exp = reduce(lambda a, b: exp.fn(a,b), args)
+
+  return exp
+
+_arithmetic = (stdops.Add, stdops.Sub, stdops.Mul, stdops.Div, stdops.Pow)
+
+def _polynomial(exp):
+  # expands, collects like terms and folds constants in one go
+  if not isinstance(exp, core.Fn) or exp.fn not in _arithmetic:
+    return exp
+
+  cache = _caches['polynomial']
+  p = polynomial.from_expression(exp, cache)
+  rv = polynomial.to_expression(p)
+  cache[rv] = p
+  return rv
 
+# the rules of a pass, as they apply to a node with normal arguments.  the
+# polynomial form takes the place of the rules on +, -, * and powers and
+# comes last, it has the final say on the order of sums and products
+_local_rules = [
+    _reorder_top,
+    _simplify_mul_div,
+    _simplify_known_values,
+    _distribute_bitand,
+    _zero_terms,
+    _reorder_top,
+    _distribute_bitand,
+    _assoc_top,
+    _simplify_bitops,
+    _simplify_mul_div,
+    _polynomial,
+    ]
+
+def _apply_local_rules(exp):
+  exp = _strip_top(exp)
+  for f in _local_rules:
+    exp = _strip_top(f(exp))
   return exp
+
+def _rebuild(node, parts):
+  for a, b in zip(parts, [node.fn] + list(node.args)):
+    if a is not b:
+      return core.Fn(parts[0], *parts[1:])
+  return node
+
+def normalize(exp):
+  '''
+  simplifies exp in a single bottom up pass
+
+  every node is normalized once, after its arguments: the rules are applied
+  at the node until they stop changing it.  what a rule builds is normalized
+  the same way, the subterms it reuses are normal already.  normal forms are
+  cached, see cache_stats
+  '''
+  results = _caches['normalize']
+  rv = results.get(exp)
+  if rv is not None:
+    return rv
+
+  # keyed by id(), the nodes are kept alive by keep
+  done = {}
+  # what a node rewrote to, its normal form is the normal form of that
+  step = {}
+  keep = []
+  stack = [exp]
+
+  while len(stack) > 0:
+    node = stack[-1]
+    if id(node) in done:
+      stack.pop()
+      continue
+
+    if id(node) in step:
+      stack.pop()
+      done[id(node)] = done[id(step[id(node)])]
+      results[node] = done[id(node)]
+      continue
+
+    if isinstance(node, core.Fn):
+      parts = [node.fn] + list(node.args)
+      pending = []
+      for a in parts:
+        if id(a) in done or (not isinstance(a, core.Fn) and a is node.fn):
+          continue
+        rv = results.get(a)
+        if rv is not None:
+          done[id(a)] = rv
+          keep.append(a)
+        else:
+          pending.append(a)
+      if len(pending) > 0:
+        pending.reverse()
+        stack.extend(pending)
+        continue
+      nxt = _rebuild(node, [done.get(id(a), a) for a in parts])
+    else:
+      nxt = node
+
+    if nxt is node:
+      nxt = _apply_local_rules(node)
+      if nxt == node:
+        stack.pop()
+        done[id(node)] = node
+        results[node] = node
+        continue
+
+    keep.append(node)
+    if id(nxt) in step and id(nxt) not in done:
+      # the rules go around in circles, where they came in is as normal as
+      # it gets.  nxt is further down the stack, its step leads here
+      stack.pop()
+      done[id(nxt)] = nxt
+      done[id(node)] = nxt
+      results[nxt] = nxt
+      results[node] = nxt
+      continue
+
+    step[id(node)] = nxt
+    stack.append(nxt)
+
+  return done[id(exp)]
@@ -1,44 +1,73 @@
 #!/usr/bin/env python
+import operator
 import z3
 import symath
+import symath.cse
+import symath.match
 
-def _convert(exp):
-  a,b = symath.wilds('a b')
-  vals = symath.WildResults()
-
-  if exp.match(a < b, vals):
-    return _convert(vals.a) < _convert(vals.b)
-  elif exp.match(a > b, vals):
-    return _convert(vals.a) > _convert(vals.b)
-  elif exp.match(symath.stdops.Equal(a, b), vals):
-    return _convert(vals.a) == _convert(vals.b)
-  elif exp.match(a <= b, vals):
-    return _cnvert(vals.a) <= _convert(vals.b)
-  elif exp.match(a >= b, vals):
-    return _convert(vals.a) >= _convert(vals.b)
-  elif exp.match(a + b, vals):
-    return _convert(vals.a) + _convert(vals.b)
-  elif exp.match(a - b, vals):
-    return _convert(vals.a) - _convert(vals.b)
-  elif exp.match(a * b, vals):
-    return _convert(vals.a) * _convert(vals.b)
-  elif exp.match(a / b, vals):
-    return _convert(vals.a) / _convert(vals.b)
-  elif exp.match(a ^ b, vals):
-    return _convert(vals.a) ^ _convert(vals.b)
-  elif exp.match(a & b, vals):
-    return _convert(vals.a) & _convert(vals.b)
-  elif exp.match(a | b, vals):
-    return _convert(vals.a) | _convert(vals.b)
-  elif exp.match(a ** b, vals):
-    return _convert(vals.a) ** _convert(vals.b)
-  elif exp.match(symath.stdops.LogicalAnd(a, b), vals):
-    return z3.And(_convert(vals.a), _convert(vals.b))
-  elif exp.match(symath.stdops.LogicalOr(a, b), vals):
-    return z3.Or(_convert(vals.a), _convert(vals.b))
-  elif exp.match(symath.stdops.LogicalXor(a, b), vals):
-    return z3.Or(z3.And(_convert(vals.a), z3.Not(_convert(vals.b))), z3.And(_convert(vals.b), z3.Not(_convert(vals.a))))
-  elif isinstance(exp, symath.Symbol) and exp.is_integer:
+_a, _b = symath.wilds('a b')
+
+def _xor(a, b):
+  return z3.Or(z3.And(a, z3.Not(b)), z3.And(b, z3.Not(a)))
+
+# binary operations, as compiled patterns and what they convert to
+_operations = [(symath.match.compile(pattern), op) for pattern, op in (
+    (_a < _b, operator.lt),
+    (_a > _b, operator.gt),
+    (symath.stdops.Equal(_a, _b), operator.eq),
+    (_a <= _b, operator.le),
+    (_a >= _b, operator.ge),
+    (_a + _b, operator.add),
+    (_a - _b, operator.sub),
+    (_a * _b, operator.mul),
+    (_a / _b, operator.div),
+    (_a ^ _b, operator.xor),
+    (_a & _b, operator.and_),
+    (_a | _b, operator.or_),
+    (_a ** _b, operator.pow),
+    (symath.stdops.LogicalAnd(_a, _b), z3.And),
+    (symath.stdops.LogicalOr(_a, _b), z3.Or),
+    (symath.stdops.LogicalXor(_a, _b), _xor)
+    )]
+
+# flattened applications of associative operators, folded from the left
+_associative = {
+    symath.stdops.Add: operator.add,
+    symath.stdops.Mul: operator.mul,
+    symath.stdops.BitAnd: operator.and_,
+    symath.stdops.BitOr: operator.or_,
+    symath.stdops.LogicalAnd: z3.And,
+    symath.stdops.LogicalOr: z3.Or
+    }
+
+# constraints that are already boolean, anything else is constrained to 0
+_predicates = [symath.match.compile(pattern) for pattern in (
+    symath.stdops.LogicalAnd(_a, _b),
+    symath.stdops.LogicalOr(_a, _b),
+    symath.stdops.LogicalXor(_a, _b),
+    symath.stdops.Equal(_a, _b),
+    _a < _b,
+    _a > _b,
+    _a <= _b,
+    _a >= _b
+    )]
+
+def _convert_node(exp, env):
+  '''
+  converts one node, its arguments are leaves or symbols bound in env
+  '''
+  if exp in env:
+    return env[exp]
+
+  if isinstance(exp, symath.core.Fn) and len(exp.args) > 2 and exp.fn in _associative:
+    return reduce(_associative[exp.fn], [_convert_node(a, env) for a in exp.args])
+
+  for pattern, op in _operations:
+    m = pattern.bind(exp)
+    if m != None:
+      return op(_convert_node(m[0], env), _convert_node(m[1], env))
+
+  if isinstance(exp, symath.Symbol) and exp.is_integer:
     return z3.Int(exp.name)
   elif isinstance(exp, symath.Symbol) and exp.is_bool:
     return z3.Bool(exp.name)
@@ -51,6 +80,16 @@ def _convert(exp):
   else:
     raise BaseException("Invalid argument (%s) (type: %s) passed to z3 solver" % (exp, type(exp)))
 
+def _convert(exp):
+  '''
+  converts exp to z3, each distinct subterm is converted once
+  '''
+  bindings, root = symath.cse.cse(exp, 1)
+  env = {}
+  for sym, node in bindings:
+    env[sym] = _convert_node(node, env)
+  return _convert_node(root, env)
+
 class Result(object):
 
   def __init__(self, model):
@@ -68,20 +107,9 @@ class ConstraintSet(set):
     super(ConstraintSet, self).__init__()
 
   def solve(self):
-    a,b = symath.wilds('a b')
-
     solver = z3.Solver()
     for i in self:
-      if \
-          i.match(symath.stdops.LogicalAnd(a, b)) or \
-          i.match(symath.stdops.LogicalOr(a, b)) or \
-          i.match(symath.stdops.LogicalXor(a, b)) or \
-          i.match(symath.stdops.Equal(a, b)) or \
-          i.match(a < b) or \
-          i.match(a > b) or \
-          i.match(a <= b) or \
-          i.match(a >= b) or \
-          i.match(a <= b):
+      if any(p.bind(i) != None for p in _predicates):
         solver.add(_convert(i))
       else:
         solver.add(_convert(i) == 0)
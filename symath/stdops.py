@@ -1,4 +1,3 @@
-import simplify
 from core import symbolic as _sym
 
 # comparison operations
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+'''
+substitution engine behind _Symbolic.substitute and Fn.recursive_substitute
+
+substitutions are made bottom up from an explicit stack.  a node whose head
+and arguments all came back unchanged is returned as is instead of being
+rebuilt, and results are cached for the duration of a call so subterms shared
+by several parents are only handled once
+'''
+
+import core
+
+def _children(node):
+  if isinstance(node, core.Fn):
+    return [node.fn] + list(node.args)
+  return []
+
+def _rebuild(node, children):
+  for i in range(len(children)):
+    if children[i] is not node[i]:
+      return core.Fn(*children)
+
+  return node
+
+def substitute_many(exps, subs):
+  '''
+  makes the substitutions in subs (a dictionary) in every expression of exps
+  in a single traversal, returns a list of the results
+
+  like substitute, the values in subs are not substituted into themselves
+  '''
+  if len(subs) == 0:
+    return list(exps)
+
+  done = {}
+  rv = []
+
+  for exp in exps:
+    stack = [exp]
+    while len(stack) > 0:
+      node = stack[-1]
+      if id(node) in done:
+        stack.pop()
+        continue
+
+      children = _children(node)
+      pending = [c for c in children if id(c) not in done]
+      if len(pending) > 0:
+        pending.reverse()
+        stack.extend(pending)
+        continue
+
+      stack.pop()
+      node_rv = _rebuild(node, [done[id(c)] for c in children])
+      if node_rv in subs:
+        node_rv = subs[node_rv]
+      done[id(node)] = node_rv
+
+    rv.append(done[id(exp)])
+
+  return rv
+
+def substitute(exp, subs):
+  '''
+  takes a dictionary of substitutions
+  returns exp with substitutions made
+  '''
+  return substitute_many((exp,), subs)[0]
+
+def recursive_substitute(exp, subs):
+  '''
+  substitutes until nothing in subs appears in the result anymore
+
+  whenever a node is replaced, the replacement is pushed back on the worklist
+  and substituted in turn, so only the parts that changed are revisited
+  '''
+  if len(subs) == 0:
+    return exp
+
+  done = {}
+  # replacements pushed on the stack, keeps their ids valid
+  pushed = []
+  stack = [exp]
+
+  while len(stack) > 0:
+    node = stack[-1]
+    if id(node) in done:
+      stack.pop()
+      continue
+
+    children = _children(node)
+    pending = [c for c in children if id(c) not in done]
+    if len(pending) > 0:
+      pending.reverse()
+      stack.extend(pending)
+      continue
+
+    node_rv = _rebuild(node, [done[id(c)] for c in children])
+    replacement = core.symbolic(subs[node_rv]) if node_rv in subs else node_rv
+    if replacement is not node_rv:
+      if id(replacement) not in done:
+        pushed.append(replacement)
+        stack.append(replacement)
+        continue
+      node_rv = done[id(replacement)]
+
+    stack.pop()
+    done[id(node)] = node_rv
+
+  return done[id(exp)]
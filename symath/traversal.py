@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+'''
+traversals over expressions
+
+expressions are interned, so a large expression is usually a DAG with many
+shared subterms.  everything here uses an explicit stack instead of python
+recursion, so deep expressions don't hit the recursion limit, and handles
+each distinct node once per traversal
+'''
+
+def walk(exp, fn):
+  '''
+  rebuilds exp bottom up, applying fn to every node after its arguments have
+  been rebuilt
+
+  leaves are passed through fn until it stops changing them, the head of a
+  function application is passed through fn once.  results are cached for
+  the duration of the walk, so a subterm shared by several parents is only
+  rewritten once
+  '''
+  # keyed by id(), every node on the stack is kept alive by exp
+  done = {}
+  stack = [exp]
+
+  while len(stack) > 0:
+    node = stack[-1]
+    if id(node) in done:
+      stack.pop()
+      continue
+
+    if len(node) == 1:
+      stack.pop()
+      oldexp = node
+      rv = fn(node)
+      while rv != oldexp:
+        oldexp = rv
+        rv = fn(rv)
+      done[id(node)] = rv
+      continue
+
+    pending = [a for a in node.args if id(a) not in done]
+    if len(pending) > 0:
+      pending.reverse()
+      stack.extend(pending)
+      continue
+
+    stack.pop()
+    args = [done[id(a)] for a in node.args]
+    done[id(node)] = fn(fn(node[0])(*args))
+
+  return done[id(exp)]
+
+def iter_subterms(exp):
+  '''
+  yields every distinct subterm of exp once, including exp itself and the
+  heads of function applications, parents before their children
+
+  nothing is rebuilt, so this never allocates or interns expressions
+  '''
+  seen = set([id(exp)])
+  stack = [exp]
+
+  while len(stack) > 0:
+    node = stack.pop()
+    yield node
+
+    if len(node) > 1:
+      for i in range(len(node) - 1, -1, -1):
+        c = node[i]
+        if id(c) not in seen:
+          seen.add(id(c))
+          stack.append(c)
+
+def find_first(exp, pred):
+  '''
+  returns the first subterm (in iter_subterms order) for which pred is true,
+  or None, without looking at the rest of the expression
+  '''
+  for node in iter_subterms(exp):
+    if pred(node):
+      return node
+
+  return None
+
+def any(exp, pred):
+  '''
+  returns True if pred is true for some subterm of exp, stops at the first one
+  '''
+  return find_first(exp, pred) is not None
+
+def collect(exp, pred):
+  '''
+  returns the set of subterms of exp for which pred is true
+  '''
+  return set(node for node in iter_subterms(exp) if pred(node))
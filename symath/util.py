@@ -21,14 +21,5 @@ def dict_reverse(d):
   return rv
 
 def has_wilds(exp):
-  rv = {}
-  rv['val'] = False
-
-  def _(exp):
-    if isinstance(exp, symath.core.Wild):
-      rv['val'] = True
-    return exp
-
-  exp.walk(_)
-  return rv['val']
+  return exp.has_wilds
 
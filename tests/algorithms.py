@@ -30,6 +30,13 @@ class TestAlgorithms(unittest.TestCase):
     exp2 = y(x, y, y, x, y, x, x, y)
     self.assertEqual(edit_distance(exp1, exp2), 3)
 
+  def test_import_fresh(self):
+    import subprocess
+    import sys
+    out = subprocess.check_output([sys.executable, '-c',
+        'import symath.algorithms; print symath.algorithms.editdistance.edit_distance.__name__'])
+    self.assertEqual(out.strip(), 'edit_distance')
+
   def xtest_print_edit_distance_metric(self):
     '''
     skip this because
@@ -18,6 +18,47 @@ class TestCoreClasses(unittest.TestCase):
     self.assertEqual(result, 37.0)
     self.assertEqual(type(result), type(37.0))
 
+  def test_compile_casts(self):
+    cexp = ((self.x << 2) | self.y).compile(self.x, self.y)
+    self.assertEqual(cexp(1, 2), 6.0)
+    self.assertEqual(type(cexp(1, 2)), type(6.0))
+    self.assertEqual((self.x / self.y - 3).compile(self.x, self.y)(1, 4), -2.75)
+
+  def test_compile_is_cached(self):
+    exp = self.x * self.y + 1
+    self.assertTrue(exp.compile(self.x, self.y) is exp.compile(self.x, self.y))
+
+    # the cache is bounded, it doesn't keep every compiled expression alive
+    cache = symath.codegen._compile.results
+    for i in range(cache.maxsize + 10):
+      (self.x + i).compile(self.x)
+    self.assertEqual(len(cache), cache.maxsize)
+
+  def test_compile_unknown_function(self):
+    cexp = (symath.functions.Sin(self.y) * 0 + self.x).compile(self.x, self.y)
+    self.assertEqual(cexp(2, 3), 2.0)
+
+  def test_compile_vectorized(self):
+    import numpy
+    exp = self.x + (self.y * self.z) ** 2
+    cexp = exp.compile_vectorized(self.x, self.y, self.z)
+    result = cexp(numpy.arange(4), 2, numpy.array([1, 2, 3, 4]))
+    self.assertEqual(list(result), [4.0, 17.0, 38.0, 67.0])
+
+    sin = symath.functions.Sin
+    cexp = (sin(self.x) + ((self.x << 2) | self.y)).compile_vectorized(self.x, self.y)
+    result = cexp(numpy.zeros(3), numpy.arange(3))
+    self.assertEqual(list(result), [0.0, 1.0, 2.0])
+
+    # one result per element, whatever the expression depends on
+    result = (self.x - self.x).compile_vectorized(self.x)(numpy.arange(4))
+    self.assertEqual(result.shape, (4,))
+    self.assertEqual(list(result), [0.0] * 4)
+    result = (self.x * 0 + self.y).compile_vectorized(self.x, self.y)(numpy.arange(4), 2)
+    self.assertEqual(list(result), [2.0] * 4)
+    result = self.y.compile_vectorized(self.x, self.y)(numpy.arange(3), numpy.ones((2, 1)))
+    self.assertEqual(result.shape, (2, 3))
+
   def test_zero(self):
     self.assertEqual((self.x * 0).simplify(), 0)
 
@@ -42,6 +83,16 @@ class TestCoreClasses(unittest.TestCase):
     self.assertTrue(isinstance(sn, symath.Number))
     self.assertEqual(sn, 3)
 
+  def test_import_is_lazy(self):
+    import subprocess
+    import sys
+    out = subprocess.check_output([sys.executable, '-c',
+        'import sys, symath; print sorted(m for m in sys.modules if m in '
+        '("numpy", "z3", "symath.simplify", "symath.solvers", "symath.calculus"))'])
+    self.assertEqual(out.strip(), '[]')
+    self.assertEqual((self.x * 1).simplify(), self.x)
+    self.assertEqual(str(symath.functions.Sin(self.x)), 'Sin(x)')
+
   def test_nonsymbol_function_head(self):
     h = self.x + self.y
     self.assertEqual(h(self.x), (self.x + self.y)(self.x))
@@ -84,6 +135,12 @@ class TestCoreClasses(unittest.TestCase):
   def test_divide_by_factor(self):
     self.assertEqual(((self.x * self.y) / self.y).simplify(), self.x)
 
+  def test_divide_by_flattened_factors(self):
+    x, y, z = self.x, self.y, self.z
+    w = symath.symbols('w')
+    self.assertEqual(((x * y * z) / (x * y)).simplify(), z)
+    self.assertEqual(((x * y * z * w) / (x * w)).simplify(), (y * z).simplify())
+
   def test_failure_case_1(self):
     self.assertEqual((self.y + self.x * self.y + self.x).simplify(), (self.x + self.y + self.x * self.y).simplify())
 
@@ -109,17 +166,185 @@ class TestCoreClasses(unittest.TestCase):
     b = self.x(4, self.y + 4)
     self.assertEqual(hash(a), hash(b))
 
+  def test_interned_instances(self):
+    f = symath.symbols('f')
+    self.assertTrue(f(self.x, self.y) is f(self.x, self.y))
+    self.assertTrue(symath.symbolic(3) is symath.symbolic(3.0))
+
+  def test_intern_tables_are_weak(self):
+    Fn = symath.core.Fn
+    f = symath.symbols('f')
+    exp = f(self.y, self.x)
+    live = Fn.__new__.live
+    hits = Fn.__new__.hits
+    f(self.y, self.x)
+    self.assertEqual(Fn.__new__.hits, hits + 1)
+    del exp
+    self.assertEqual(Fn.__new__.live, live - 1)
+    self.assertTrue('Fn' in symath.core.intern_stats())
+
+  def test_raw_operands_intern_once(self):
+    Fn = symath.core.Fn
+    live = Fn.__new__.live
+    misses = Fn.__new__.misses
+    exp = self.x + 12345
+    self.assertEqual(Fn.__new__.live, live + 1)
+    self.assertEqual(Fn.__new__.misses, misses + 1)
+    self.assertTrue(exp is self.x + symath.symbolic(12345))
+    self.assertTrue(Fn.__new__.get(Fn, symath.stdops.Add, self.x, 12345) is exp)
+
+  def test_concurrent_interning(self):
+    import sys
+    import threading
+    g = symath.symbols('concurrent_g')
+    results = []
+
+    def _build():
+      rv = {}
+      for i in range(500):
+        rv[i] = g(self.x, i) + i
+      results.append(rv)
+
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      threads = [threading.Thread(target=_build) for i in range(8)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+    finally:
+      sys.setcheckinterval(interval)
+
+    for i in range(500):
+      self.assertTrue(all(rv[i] is results[0][i] for rv in results))
+
+  def test_structural_hash(self):
+    self.assertNotEqual(hash(self.x + self.y), hash(self.x + self.z))
+    self.assertNotEqual(hash(self.x + self.y), hash(self.x * self.y))
+    self.assertNotEqual(hash(symath.symbols('a')), hash(symath.wilds('a')))
+
+  def test_simplify_is_deterministic(self):
+    import subprocess
+    import sys
+    script = ('import symath; x, y, z, w = symath.symbols("x y z w"); '
+        'print [str(e.simplify()) for e in [(x * 2 + y * 2) * (z - z + 1), '
+        'x * y * x * z * y, (x + y) * (x - y) * z, (x & y | z) & (x | w), '
+        '(x * y) ** 2 * x * w / y]], hash(x * y + 1)')
+    outs = set(subprocess.check_output([sys.executable, '-c', script]) for i in range(4))
+    self.assertEqual(len(outs), 1)
+
+  def test_compact_layout(self):
+    exp = self.x + self.y
+    self.assertFalse(hasattr(exp, '__dict__'))
+    self.assertFalse(hasattr(self.x, '__dict__'))
+    self.assertEqual(exp.name, '+')
+    self.assertTrue(exp.kargs is symath.stdops.Add.kargs)
+    self.assertEqual(symath.symbolic(2).name, '2.0')
+
+  def test_walk_deep_expression(self):
+    exp = self.x
+    for i in range(5000):
+      exp = self.y(exp)
+    self.assertTrue(exp.walk(lambda e: e) is exp)
+    self.assertTrue(self.x in exp)
+
+  def test_walk_shared_subterms_once(self):
+    exp = self.x
+    for i in range(60):
+      exp = exp + exp
+
+    seen = []
+    def _(e):
+      seen.append(e)
+      return e
+
+    self.assertTrue(exp.walk(_) is exp)
+    self.assertTrue(len(seen) < 200)
+
   def test_simplify_bitops(self):
     self.assertEqual((self.x ^ self.x).simplify(), 0)
     self.assertEqual((self.x & self.x).simplify(), (self.x).simplify())
     self.assertEqual((self.x | self.x).simplify(), (self.x).simplify())
     self.assertEqual(((self.x << 8) >> 8).simplify(), (self.x).simplify())
 
+  def test_simplify_cache(self):
+    import symath.simplify as simplify
+    simplify.clear_cache()
+    exp = (self.x * 2 + self.y * 2) * (self.z - self.z + 1)
+    rv = exp.simplify()
+    stats = simplify.cache_stats()['normalize']
+    self.assertTrue(rv.simplify() is rv)
+    self.assertTrue(exp.simplify() is rv)
+    self.assertEqual(simplify.cache_stats()['normalize']['hits'], stats['hits'] + 2)
+    self.assertEqual(simplify.cache_stats()['normalize']['misses'], stats['misses'])
+
+    # the shared subterms aren't normalized again
+    self.assertEqual((self.y + exp).simplify(), (self.y + rv).simplify())
+    self.assertTrue(simplify.cache_stats()['normalize']['hits'] > stats['hits'] + 2)
+
+  def test_normalize(self):
+    import symath.simplify as simplify
+    x, y, z = self.x, self.y, self.z
+    cases = [(x * 1, x), (x + 0, x), (x * x * x, x ** 3), ((2 * x) * x, 2 * x ** 2),
+        (x + y * x, x + x * y), (x - y, x + -1 * y), (x + y * y + x, 2 * x + y ** 2),
+        (((3 + x) / (2 + x)) * (2 + x), 3 + x), ((x * y) / y, x), (x ^ x, 0),
+        ((x << 8) >> 8, x), (symath.symbolic(0) - 1, -1)]
+    for exp, rv in cases:
+      self.assertEqual(simplify.normalize(exp), rv)
+
+    # rules that undo each other stop where they started
+    exp = 3 * ((1 | y) * (z + 1))
+    self.assertEqual(exp.simplify(), exp.simplify().simplify())
+
+  def test_flattened_operators(self):
+    from symath.core import Fn
+    from symath.stdops import Add, Mul, BitOr, BitAnd
+    x, y, z = self.x, self.y, self.z
+    self.assertEqual(str(Fn(Add, x, y, z)), '(x + y + z)')
+    self.assertEqual((z + x + (y + x)).simplify(), Fn(Add, y, z, 2 * x))
+    self.assertEqual((x * z * y * 2).simplify(), Fn(Mul, 2, x, y, z))
+    self.assertEqual((z | x | y | x).simplify(), Fn(BitOr, x, y, z))
+    self.assertEqual((x & 6 & y & 3).simplify(), Fn(BitAnd, 2, x, y))
+    self.assertEqual((x | 0 | y | 0).simplify(), x | y)
+
+    # once flattened, simplifying again changes nothing
+    exp = (x * y * z + x + y * x + 3).simplify()
+    self.assertEqual(len(exp.args), 4)
+    self.assertTrue(exp.simplify() is exp)
+    self.assertTrue(exp.walk(symath.simplify._assoc_top) is exp)
+    self.assertEqual(exp.compile(x, y, z)(1, 2, 3), 12)
+
   def test_contains(self):
     a = symath.wild('a')
     self.assertTrue((self.y + a) in (self.x * (self.y + self.z)))
     self.assertFalse((self.y + self.x) in (self.x * (self.y + self.z)))
 
+  def test_contains_does_not_build(self):
+    exp = self.x * (self.y + self.z) + self.z
+    misses = symath.core.Fn.__new__.misses
+    self.assertTrue(self.y in exp)
+    self.assertFalse(symath.symbols('w') in exp)
+    self.assertEqual(symath.core.Fn.__new__.misses, misses)
+
+  def test_read_only_visitors(self):
+    import symath.traversal as traversal
+    exp = self.x * (self.y + self.z)
+
+    seen = []
+    def _(e):
+      seen.append(e)
+      return e == self.x * (self.y + self.z)
+
+    self.assertTrue(traversal.any(exp, _))
+    self.assertEqual(seen, [exp])
+
+    self.assertEqual(traversal.find_first(exp, lambda e: isinstance(e, symath.Symbol) and e.name == 'y'), self.y)
+    self.assertEqual(traversal.find_first(exp, lambda e: False), None)
+    self.assertEqual(symath.collect(exp, lambda e: isinstance(e, symath.Symbol)), \
+        set([self.x, self.y, self.z, symath.stdops.Add, symath.stdops.Mul]))
+    self.assertEqual(len(list(traversal.iter_subterms((self.x + self.x) * (self.x + self.x)))), 5)
+
   def test_wilds_dont_substitute(self):
     '''
     it is implicitly assumed that substitute is too "dumb" to account for wilds
@@ -135,6 +360,63 @@ class TestCoreClasses(unittest.TestCase):
     self.assertEqual(x(a).substitute(subs), x(x)) # this one *should* substitute
     self.assertEqual(x(b).substitute(subs), x(b))
 
+  def test_substitute_preserves_identity(self):
+    exp = self.x(self.y + 1, self.z * 2)
+    misses = symath.core.Fn.__new__.misses
+    self.assertTrue(exp.substitute({symath.symbols('w'): 3}) is exp)
+    self.assertEqual(symath.core.Fn.__new__.misses, misses)
+    self.assertEqual(exp.substitute({self.y: self.z}), self.x(self.z + 1, self.z * 2))
+
+  def test_recursive_substitute(self):
+    exp = self.x(self.y, self.y + self.z)
+    two = symath.symbolic(2)
+    subs = {self.y: self.z + 1, self.z: two}
+    self.assertEqual(exp.recursive_substitute(subs), self.x(two + 1, (two + 1) + two))
+    self.assertEqual(exp.recursive_substitute({self.y: self.y}), exp)
+
+  def test_metadata(self):
+    a = symath.wild('a')
+    exp = self.x(self.y + 1, self.z)
+    self.assertEqual(exp.size, 5)
+    self.assertEqual(exp.depth, 3)
+    self.assertEqual(exp.free_symbols, frozenset([self.x, self.y, self.z, symath.stdops.Add]))
+    self.assertFalse(exp.has_wilds)
+    self.assertTrue(self.x(a).has_wilds)
+    self.assertEqual(exp.head, self.x)
+    self.assertEqual((self.x + self.y)(self.z).head, symath.stdops.Add)
+    self.assertTrue(exp.metadata is exp.metadata)
+    self.assertTrue(exp.free_symbols is exp.free_symbols)
+    self.assertTrue((self.x + 1)(self.x).free_symbols is (self.x + 1).free_symbols)
+
+  def test_metadata_deep_expression(self):
+    exp = self.x
+    for i in range(5000):
+      exp = exp + 1
+    self.assertEqual(exp.depth, 5001)
+    self.assertEqual(exp.size, 10001)
+    self.assertEqual(exp.sort_key[0], 3)
+
+  def test_sort_key(self):
+    x, y, z = self.x, self.y, self.z
+    exps = [x(y, 1), x + y, y, x, symath.symbolic(2), symath.symbolic(-1), x(y)]
+    exps.sort(key=lambda e: e.sort_key)
+    self.assertEqual(exps, [symath.symbolic(-1), symath.symbolic(2), x, y, x + y, x(y), x(y, 1)])
+    self.assertTrue((x + y).sort_key is (x + y).sort_key)
+    self.assertTrue((x + y)(z).sort_key[1] is (x + y).sort_key)
+    self.assertEqual((z * y * x).simplify(), (x * y * z).simplify())
+
+  def test_sort_key_deep_expressions(self):
+    f = symath.symbols('f')
+    a, b = self.x, self.y
+    for i in range(5000):
+      a, b = f(a), f(b)
+    self.assertTrue(a.sort_key < b.sort_key)
+    self.assertFalse(a.sort_key == b.sort_key)
+    self.assertEqual(sorted([b, a], key=lambda e: e.sort_key), [a, b])
+    self.assertEqual((b + a).simplify(), (a + b).simplify())
+    self.assertTrue(f(a, b).sort_key > f(a).sort_key)
+    self.assertEqual(hash(a.sort_key), hash(a.sort_key))
+
   def test_symbol_inequal_wild(self):
     a = symath.wilds('a')
     sa = symath.symbols('a')
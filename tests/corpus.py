@@ -0,0 +1,57 @@
+import unittest
+import symath
+from symath.corpus import Corpus
+
+class TestCorpus(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.f, self.g = symath.symbols('x y f g')
+    self.a, self.b = symath.wilds('a b')
+    x, y, f, g = self.x, self.y, self.f, self.g
+    self.exps = [f(x, 1), f(y, 2), g(x, 1), f(x), x * 4 + y, (y + 4) * x, f(x, x), x]
+    self.corpus = Corpus(self.exps)
+
+  def test_candidates(self):
+    x, y, f, g, a, b = self.x, self.y, self.f, self.g, self.a, self.b
+    self.assertEqual(self.corpus.candidates(f(a, b)), [0, 1, 6])
+    self.assertEqual(self.corpus.candidates(f(x, b)), [0, 6])
+    self.assertEqual(self.corpus.candidates(a(x, 1)), [0, 2, 4, 5, 6])
+    self.assertEqual(self.corpus.candidates(a), range(len(self.exps)))
+    self.assertEqual(self.corpus.candidates(x), [7])
+    self.assertEqual(self.corpus.candidates(g(y, a)), [])
+    self.assertEqual(self.corpus.candidates(self.a(1)), [3])
+
+    # the index isn't handed out
+    self.corpus.candidates(f(a, b)).append(7)
+    self.assertEqual(self.corpus.candidates(f(a, b)), [0, 1, 6])
+    self.corpus.candidates(f(x, b)).append(7)
+    self.assertEqual(self.corpus.candidates(f(x, b)), [0, 6])
+
+    # expressions added after a query are indexed on the next one
+    self.corpus.add(f(x, y))
+    self.assertEqual(self.corpus.candidates(f(x, b)), [0, 6, 8])
+    self.assertEqual(self.corpus.candidates(f(a, y)), [1, 8])
+
+  def test_search(self):
+    x, y, f, a, b = self.x, self.y, self.f, self.a, self.b
+    found = [(e, vals.b) for e, vals in self.corpus.search(f(a, b))]
+    self.assertEqual(found, [(f(x, 1), 1), (f(y, 2), 2), (f(x, x), x)])
+    self.assertEqual([e for e, vals in self.corpus.search(f(a, a))], [f(x, x)])
+
+    # the same matches as a loop over match
+    pattern = a * (b + 4)
+    expected = [e for e in self.exps if e.match(pattern)]
+    self.assertEqual([e for e, vals in self.corpus.search(pattern)], expected)
+    self.assertEqual([e for e, vals in self.corpus.search(pattern, ac=True)], [(y + 4) * x])
+    self.assertEqual(self.corpus.count((b + 4) * a, ac=True), 1)
+
+  def test_search_pool(self):
+    a, b = self.a, self.b
+    corpus = Corpus(self.f(self.x, i) + i for i in range(500))
+    serial = [(e, vals.b) for e, vals in corpus.search(self.f(a, b) + b)]
+    pooled = [(e, vals.b) for e, vals in corpus.search(self.f(a, b) + b, processes=2, chunksize=64)]
+    self.assertEqual(len(serial), 500)
+    self.assertEqual(serial, pooled)
+
+if __name__ == '__main__':
+  unittest.main()
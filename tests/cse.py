@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import unittest
+import symath
+from symath.cse import cse
+
+class TestCSE(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.z = symath.symbols('x y z')
+
+  def test_shared_subterm(self):
+    s = self.x + self.y
+    bindings, root = cse(s * s)
+    self.assertEqual(len(bindings), 1)
+    sym, val = bindings[0]
+    self.assertEqual(val, s)
+    self.assertEqual(root, sym * sym)
+
+  def test_nothing_shared(self):
+    exp = self.x * (self.y + self.z)
+    self.assertEqual(cse(exp), ([], exp))
+
+  def test_topological_order(self):
+    s = self.x + self.y
+    t = s * s
+    exp = symath.symbols('f')(t, t, s)
+    bindings, root = cse(exp)
+    self.assertEqual([v for k, v in bindings], [s, bindings[0][0] * bindings[0][0]])
+
+    env = {}
+    for k, v in bindings:
+      env[k] = v.substitute(env)
+    self.assertEqual(root.substitute(env), exp)
+
+  def test_threshold_one_binds_everything(self):
+    bindings, root = cse(self.x * (self.y + self.z), 1)
+    self.assertEqual(len(bindings), 1)
+    self.assertEqual(root, self.x * bindings[0][0])
+
+  def test_fresh_symbols_dont_clash(self):
+    used = symath.symbols('_cse0')
+    s = self.x + used
+    bindings, root = cse(s * s)
+    self.assertNotEqual(bindings[0][0], used)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import symath
+import symath.corpus
 
 class TestCoreClasses(unittest.TestCase):
 
@@ -20,6 +21,105 @@ class TestCoreClasses(unittest.TestCase):
     self.assertTrue(self.head(self.x, self.x).match(self.head(self.v, self.v), m))
     self.assertEqual(m['v'], self.x)
 
+  def test_compiled_pattern(self):
+    import symath.match as match
+    w, v, x, y = self.w, self.v, self.x, self.y
+    p = match.compile(w(x, v + v))
+    self.assertTrue(p is match.compile(w(x, v + v)))
+    self.assertEqual(p.names, ('v', 'w'))
+    self.assertEqual(p.bind(self.head(x, y + y)), (y, self.head))
+    self.assertEqual(p.bind(self.head(x, y + x)), None)
+    self.assertEqual(p.bind(self.head(y, y + y)), None)
+    self.assertEqual(p.bind(self.head(x)), None)
+    self.assertEqual(p.bind(x), None)
+    self.assertEqual(p.extract((x + 1)(x, symath.symbolic(2) + 2)), {'w': x + 1, 'v': 2})
+    self.assertEqual(match.compile(w + v, 'w v').bind(x + 2), (x, 2))
+    self.assertEqual(match.compile(x * 2).bind(x * 2.0), ())
+
+    # agrees with the generic extract
+    pattern = (w * (v / 3))(w)
+    for exp in [(x * (y / 3))(x), (x * (y / 3))(y), (x * (y / 2))(x), x]:
+      self.assertEqual(match.compile(pattern).extract(exp), match.extract(exp, pattern))
+
+  def test_interpreted_match(self):
+    import symath.match as match
+    w, v, x, y = self.w, self.v, self.x, self.y
+    before = match._compile.misses
+    self.assertTrue(self.head(x, y + y).match(w(x, v + v)))
+    self.assertEqual(match._compile.misses, before)
+    self.assertEqual(match.compile(self.head(x, y)).source, None)
+    self.assertEqual(match.compile(self.head(x, y)).bind(self.head(x, y)), ())
+
+    exp = x
+    for i in range(5000):
+      exp = self.head(exp, y)
+    self.assertTrue(exp.match(exp))
+    self.assertEqual(match.extract(exp, self.head(w, v)), {'w': exp.args[0], 'v': y})
+
+  def test_ac_match(self):
+    import symath.match as match
+    a, b = symath.wilds('a b')
+    x, y = self.x, self.y
+    z = symath.symbols('z')
+    p = match.compile(a + (a * b), ac=True)
+    self.assertEqual(p.extract((y * x) + x), {'a': x, 'b': y})
+    self.assertEqual(p.extract(x + (x * y)), {'a': x, 'b': y})
+    self.assertEqual(p.bind(x + y), None)
+    self.assertEqual(match.compile(a + a, ac=True).extract((x + y) + (y + x)), {'a': x + y})
+    self.assertEqual(match.compile(a + b, 'a b', ac=True).bind(x + y + z), (x, y + z))
+    self.assertEqual(match.compile(a - b, 'a b', ac=True).bind(x - y), (x, y))
+    self.assertEqual(match.compile(a - b, ac=True).bind(x + y), None)
+    self.assertTrue((y * x).match(x * a, ac=True))
+    self.assertFalse((y * x).match(x * a))
+
+  def test_compile_names(self):
+    import symath.match as match
+    a, b = symath.wilds('a b')
+    p = match.compile(a - b, ['b', 'a'])
+    self.assertEqual(p.bind(self.x - self.y), (self.y, self.x))
+    self.assertTrue(match.compile(a - b, 'b a') is p)
+
+  def test_flattened_match(self):
+    import symath.match as match
+    from symath.core import Fn
+    from symath.stdops import Add, Mul
+    a, b, c = symath.wilds('a b c')
+    x, y = self.x, self.y
+    z = symath.symbols('z')
+    exp = Fn(Add, x, y, Fn(Mul, 2, y, z))
+    self.assertEqual(match.compile(a + b, 'a b').bind(exp), (x, y + Fn(Mul, 2, y, z)))
+    self.assertEqual(match.compile(a + (2 * b)).extract(exp), {'a': x + y, 'b': y * z})
+    self.assertTrue(exp.match(a + b + c))
+    self.assertFalse(exp.match(a(b, c)))
+    self.assertEqual(symath.replace(exp, {a + (a * b): a * (b + 1)}), exp)
+    self.assertEqual(symath.replace(Fn(Add, x, y, z), {x + a: a}), y + z)
+    self.assertEqual(symath.corpus.Corpus([exp, x + y]).count(a + b), 2)
+
+  def test_flattened_match_by_position(self):
+    import symath.match as match
+    from symath.core import Fn
+    from symath.stdops import Add
+    a, b, c, d = symath.wilds('a b c d')
+    x, y = self.x, self.y
+    z, w, f = symath.symbols('z w f')
+    flat = Fn(Add, x, y, z)
+
+    # only the flattened operand is matched as a multiset
+    pattern = f(a - b, c + d)
+    for extract in (match.compile(pattern).extract, lambda e: match.extract(e, pattern)):
+      self.assertEqual(extract(f(x - y, flat)), {'a': x, 'b': y, 'c': x, 'd': y + z})
+
+    for pattern in (f(x + a, y + b), f(x - a, b + c), Fn(Add, a, b ^ x)):
+      for e in (f(flat, x + y), f(y - x, flat), Fn(Add, y, z, x ^ y)):
+        self.assertEqual(match.compile(pattern).bind(e), None)
+        self.assertEqual(match.extract(e, pattern), None)
+    self.assertEqual(match.compile(Fn(Add, a, b ^ x), ac=True).extract(Fn(Add, y, z, x ^ y)),
+        {'a': Fn(Add, y, z), 'b': y})
+
+    # the operands left over stay flattened
+    self.assertEqual(match.compile(x + a).extract(Fn(Add, x, y, z, w)), {'a': Fn(Add, y, z, w)})
+    self.assertEqual(match.compile(x + a, ac=True).extract(Fn(Add, x, y, z, w)), {'a': Fn(Add, y, z, w)})
+
   def test_none_wild_match(self):
     m = {'should be removed': True}
     self.assertTrue(self.head(self.x).match(symath.wild()(self.x), m))
@@ -31,5 +131,50 @@ class TestCoreClasses(unittest.TestCase):
     term = (x & (y | z))
     self.assertEqual(y | z, symath.replace(term, { a & b: b }))
 
+  def test_replace_normal_form(self):
+    a, b = symath.wilds('a b')
+    f, g, h = symath.symbols('f g h')
+    rules = {f(a): g(a), g(g(a)): a, h(a, b): h(b, a) + 0}
+    self.assertEqual(symath.replace(f(f(self.x)), rules), self.x)
+    self.assertEqual(symath.replace(self.head(f(self.x), f(f(self.y))), rules), self.head(g(self.x), self.y))
+    self.assertEqual(symath.replace(f(f(self.x)), rules, repeat=False), g(g(self.x)))
+
+    exp = self.x
+    for i in range(3000):
+      exp = f(exp)
+    self.assertEqual(symath.replace(exp, [(f(f(a)), a)]), self.x)
+
+    # rules that go around in circles stop where they came in
+    self.assertEqual(symath.replace(h(self.x, self.y), {h(a, b): h(b, a)}), h(self.x, self.y))
+    self.assertEqual(symath.replace(f(h(self.x, self.y)), {h(a, b): h(b, a), f(a): g(a)}),
+        g(h(self.x, self.y)))
+
+    # and so do those that go around through the arguments
+    k = symath.symbols('k')
+    rules = [(f(a), g(h(a))), (g(k(a)), g(h(a))), (h(a), k(a))]
+    self.assertEqual(symath.replace(f(self.x), rules), g(h(self.x)))
+    self.assertEqual(symath.replace(f(f(self.x)), rules), g(k(g(h(self.x)))))
+
+  def test_dict_rule_order(self):
+    import symath.rewrite as rewrite
+    a = symath.wild('a')
+    f, g = symath.symbols('f g')
+    rules = dict((f(a, i), i) for i in range(20))
+    rules[g(a)] = 20
+    index = rewrite.RuleIndex(rules)
+    self.assertEqual([r.replacement for r in index.rules], [symath.symbolic(i) for i in range(21)])
+
+  def test_rule_index(self):
+    import symath.rewrite as rewrite
+    a, b = symath.wilds('a b')
+    f, g = symath.symbols('f g')
+    rules = [(f(a), 1), (f(a, b), 2), (g(a), 3), (a(b), 4), (a, 5), (self.x, 6)]
+    index = rewrite.RuleIndex(rules)
+    orders = lambda exp: [r.order for r in index.candidates(exp)]
+    self.assertEqual(orders(f(self.y)), [0, 3, 4])
+    self.assertEqual(orders(f(self.y, self.y)), [1, 4])
+    self.assertEqual(orders(self.x), [4, 5])
+    self.assertEqual(orders(self.y), [4])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import unittest
+import symath.memoize as memoize
+from symath.memoize import Memoize
+
+class TestMemoize(unittest.TestCase):
+
+  def test_unbounded(self):
+    calls = []
+    @Memoize
+    def f(a, b=0):
+      calls.append(a)
+      return (a, b)
+
+    self.assertEqual([f(1), f(1), f(1, b=2), f(1, b=2), f(())], [(1, 0), (1, 0), (1, 2), (1, 2), ((), 0)])
+    self.assertEqual(calls, [1, 1, ()])
+    self.assertEqual(f.stats(), {'size': 3, 'hits': 2, 'misses': 3, 'evictions': 0})
+
+  def test_generators_are_expanded(self):
+    f = Memoize(lambda n: (i for i in range(n)))
+    self.assertEqual(f(3), [0, 1, 2])
+    self.assertEqual(f(3), [0, 1, 2])
+
+  def test_lru(self):
+    f = Memoize.Bounded(maxsize=3)(lambda a: a * a)
+    for i in [1, 2, 3, 1, 4, 5, 1]:
+      f(i)
+    self.assertEqual(sorted(f.results.keys()), [(1,), (4,), (5,)])
+    self.assertEqual(f.evictions, 2)
+
+  def test_lfu(self):
+    f = Memoize.Bounded(maxsize=3, policy=memoize.LFU)(lambda a: a * a)
+    for i in [1, 1, 2, 2, 3, 4, 5, 2, 6]:
+      f(i)
+    self.assertEqual(sorted(f.results.keys()), [(1,), (2,), (6,)])
+    self.assertEqual(f.evictions, 3)
+
+  def test_lfu_admits_new_keys(self):
+    f = Memoize.Bounded(maxsize=2, policy=memoize.LFU)(lambda a: a)
+    for i in ['a'] * 3 + ['b'] * 2 + ['c', 'd']:
+      f(i)
+    self.assertEqual(sorted(f.results.keys()), [('a',), ('d',)])
+    f('d')
+    self.assertEqual(f.hits, 4)
+
+  def test_maxbytes(self):
+    f = Memoize.Bounded(maxbytes=1000)(lambda n: 'x' * n)
+    for i in range(100, 120):
+      self.assertEqual(f(i), 'x' * i)
+    self.assertTrue(f.results.bytes <= 1000)
+    self.assertEqual(f.evictions + len(f.results), 20)
+
+  def test_registry(self):
+    f = Memoize.Bounded(maxsize=10)(lambda a: a)
+    f(1)
+    self.assertTrue(f in memoize.caches())
+    self.assertTrue(f.name in memoize.cache_stats())
+    memoize.clear_all()
+    self.assertEqual(len(f.results), 0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -30,5 +30,14 @@ class TestZ3(cls):
     r = cs.solve()
     self.assertNotEqual(r, None)
 
+  def test_flattened_operators(self):
+    x, y = self.x, self.y
+    cs = solvers.z3.ConstraintSet()
+    cs.add(symath.stdops.Equal((x + y + x * y + 1).simplify(), 12))
+    cs.add(symath.stdops.Equal(y, 2))
+    r = cs.solve()
+    self.assertNotEqual(r, None)
+    self.assertEqual(r.x, 3)
+
 if __name__ == '__main__':
   unittest.main()
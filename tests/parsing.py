@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+import symath
+import symath.parsing as parsing
+
+class TestParsing(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.f = symath.symbols('x y f')
+
+  def test_roundtrip(self):
+    x, y, f = self.x, self.y, self.f
+    exps = [
+        x,
+        x + y * 3,
+        x * -1,
+        x ** 2.5,
+        f(x, 1e-05, symath.symbolic(True)),
+        f(),
+        (x + y)(x - y),
+        symath.stdops.LogicalAnd(x, y) >> 4,
+        symath.stdops.Sub(x),
+        f(symath.stdops.Add, x)
+        ]
+    for exp in exps:
+      self.assertTrue(parsing.parse(str(exp)) is exp, str(exp))
+
+  def test_roundtrip_flattened(self):
+    x, y, f = self.x, self.y, self.f
+    z = symath.symbols('z')
+    exp = (x + y + z).simplify()
+    self.assertEqual(len(exp.args), 3)
+    self.assertTrue(parsing.parse(str(exp)) is exp)
+    exp = (f(x * y * 2 * z) | x | 3 | (x + y + 1)).simplify()
+    self.assertTrue(parsing.parse(str(exp)) is exp, str(exp))
+    self.assertRaises(parsing.ParseError, parsing.parse, '(x + y * z)')
+
+  def test_operators_keep_properties(self):
+    exp = parsing.parse('((x * 1) + (y + 0))')
+    self.assertTrue(exp.fn is symath.stdops.Add)
+    self.assertEqual(exp.simplify(), self.x + self.y)
+
+  def test_deep(self):
+    # str() itself recurses, so build the text by hand
+    exp = self.x
+    for i in range(5000):
+      exp = self.f(exp, i)
+    text = 'f(' * 5000 + 'x' + ''.join(',%d)' % (i,) for i in range(5000))
+    self.assertTrue(parsing.parse(text) is exp)
+
+  def test_errors(self):
+    for text in ['(x + y', 'f(x,)', 'x y', ')', '(x + y))', '']:
+      self.assertRaises(parsing.ParseError, parsing.parse, text)
+
+  def test_lines(self):
+    exps = [self.x + 1, self.f(self.y), self.x * self.y]
+    fd, path = tempfile.mkstemp()
+    try:
+      with os.fdopen(fd, 'w') as f:
+        f.write('\n'.join(map(str, exps)) + '\n\n')
+      self.assertEqual(parsing.load(path), exps)
+    finally:
+      os.remove(path)
+
+    lines = iter(map(str, exps))
+    it = parsing.parse_lines(lines)
+    self.assertEqual(next(it), exps[0])
+    self.assertEqual(next(lines), str(exps[1]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import symath
+import symath.persist as persist
+from symath.memoize import Memoize
+
+class TestPersist(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.f = symath.symbols('x y f')
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'cache.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_pickle_interned(self):
+    exp = self.f(self.x + 2.5, symath.symbolic(True), symath.stdops.Add) * self.y
+    self.assertTrue(pickle.loads(pickle.dumps(exp, 2)) is exp)
+    self.assertTrue(pickle.loads(pickle.dumps(exp, 0)) is exp)
+    self.assertTrue(pickle.loads(pickle.dumps(symath.wild('a'))) is symath.wild('a'))
+
+  def test_pickle_keeps_live_domain(self):
+    n = symath.symbols('pickled_n')
+    n.is_integer = True
+    data = pickle.dumps(n + 1)
+    self.assertTrue(pickle.loads(data) is n + 1)
+    n.is_integer = False
+    self.assertRaises(symath.core.DomainError, pickle.loads, data)
+    self.assertFalse(n.is_integer)
+
+  def test_fingerprint(self):
+    a = self.f(self.x, 1)
+    self.assertEqual(a.fingerprint, self.f(self.x, 1.0).fingerprint)
+    self.assertNotEqual(a.fingerprint, self.f(1, self.x).fingerprint)
+    self.assertNotEqual(self.x.fingerprint, symath.wild('x').fingerprint)
+
+    out = subprocess.check_output([sys.executable, '-c',
+        'import symath; x, f = symath.symbols("x f"); print f(x, 1).fingerprint'])
+    self.assertEqual(out.strip(), a.fingerprint)
+
+  def test_results_survive(self):
+    calls = []
+    def square(exp, times=1):
+      calls.append(exp)
+      return (exp * exp, times)
+
+    first = Memoize.Persistent(self.path, 'square')(square)
+    self.assertEqual(first(self.x + 1), ((self.x + 1) * (self.x + 1), 1))
+    self.assertEqual(first(self.x + 1, times=2), ((self.x + 1) * (self.x + 1), 2))
+
+    # a fresh cache on the same database, as after a restart
+    second = Memoize.Persistent(self.path, 'square')(square)
+    self.assertEqual(second(self.x + 1), ((self.x + 1) * (self.x + 1), 1))
+    self.assertEqual(second(self.x + 1, times=2), ((self.x + 1) * (self.x + 1), 2))
+    self.assertEqual(len(calls), 2)
+    self.assertEqual(second.hits, 2)
+
+    self.assertEqual(len(second.results), len(second.results.keys()))
+    self.assertEqual(second.results.stored(), 2)
+    second.results.drop()
+    self.assertEqual(len(second.results), 0)
+    self.assertEqual(second.results.stored(), 0)
+
+  def test_symbol_domains(self):
+    n = symath.symbols('persisted_n')
+    calls = []
+    def plus_one(exp):
+      calls.append(exp)
+      return exp + 1
+
+    n.is_integer = True
+    first = Memoize.Persistent(self.path, 'plus_one')(plus_one)
+    self.assertEqual(first(n + 1), n + 1 + 1)
+    self.assertNotEqual(persist.key_fingerprint(n), persist.key_fingerprint(self.x))
+
+    n.is_integer = False
+    second = Memoize.Persistent(self.path, 'plus_one')(plus_one)
+    self.assertEqual(second(n + 1), n + 1 + 1)
+    self.assertEqual(len(calls), 2)
+    self.assertFalse(n.is_integer)
+
+  def test_unreadable_value_is_miss(self):
+    n = symath.symbols('unreadable_n')
+    results = persist.SqliteResults(self.path, 'unreadable')
+    results[self.x] = n
+    n.is_integer = True
+    results.clear()
+    self.assertFalse(self.x in results)
+    n.is_integer = False
+    results.close()
+
+  def test_connection_per_process(self):
+    results = persist.SqliteResults(self.path, 'lazy')
+    self.assertTrue(results._db is None)
+    results[self.x] = 1
+    db = results.db
+    self.assertTrue(db is results.db)
+
+    pid = os.fork()
+    if pid == 0:
+      # the child has its own connection to the same database
+      code = 1
+      try:
+        if results.db is not db and results[self.x] == 1:
+          results[self.y] = 2
+          code = 0
+      finally:
+        os._exit(code)
+    self.assertEqual(os.waitpid(pid, 0)[1], 0)
+    self.assertEqual(results.stored(), 2)
+    results.close()
+
+  def test_unpersistable_keys(self):
+    f = persist.attach(Memoize(lambda a: 1), self.path)
+    key = object()
+    self.assertEqual(f(key), 1)
+    self.assertEqual(f(key), 1)
+    self.assertEqual(f.results.stored(), 0)
+    self.assertRaises(TypeError, persist.key_fingerprint, (key,))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import symath
+import symath.polynomial as polynomial
+from symath.polynomial import Polynomial
+
+class TestPolynomial(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.z = symath.symbols('x y z')
+
+  def test_from_expression(self):
+    x, y = self.x, self.y
+    p = polynomial.from_expression((x + 1) * (x - 1))
+    self.assertEqual(p.gens, (x,))
+    self.assertEqual(p.terms, {(0,): -1.0, (2,): 1.0})
+    self.assertEqual(polynomial.from_expression(x * y - y * x), Polynomial())
+    self.assertEqual(polynomial.from_expression((x / 2) * 4), Polynomial.generator(x).scale(2))
+    self.assertEqual(polynomial.from_expression(symath.symbolic(2) ** 3 - 1).terms, {(): 7.0})
+
+    # what isn't arithmetic is a generator
+    p = polynomial.from_expression((x | y) * 2 + x ** y)
+    self.assertEqual(p.gens, (x ** y, x | y))
+    p = polynomial.from_expression((x + y) ** 2)
+    self.assertEqual(p.gens, ((x + y) ** 2,))
+    self.assertEqual(polynomial.from_expression((2 * x) ** 2).terms, {(2,): 4.0})
+
+  def test_to_expression(self):
+    x, y, z = self.x, self.y, self.z
+    self.assertEqual(polynomial.expand((x + 1) * (x - 1)), -1 + x ** 2)
+    self.assertEqual(polynomial.expand(y * x + x * 2), (2 * x) + (x * y))
+    self.assertEqual(polynomial.expand(x - x), 0)
+    self.assertEqual(polynomial.expand(3 * x * x * 2), 6 * x ** 2)
+    self.assertRaises(polynomial.PolynomialError, polynomial.to_expression, x)
+
+    # the same polynomial, whatever the order of the terms
+    a = polynomial.expand((x + y) * (y + z) * (z + x))
+    b = polynomial.expand((z + x) * (x + y) * (y + z))
+    self.assertTrue(a is b)
+
+  def test_cache(self):
+    x, y = self.x, self.y
+    cache = {}
+    exp = (x + 1) * (y + 1)
+    p = polynomial.from_expression(exp, cache)
+    self.assertTrue(cache[exp] is p)
+    self.assertEqual(polynomial.from_expression(exp * 2, cache).terms, p.scale(2).terms)
+
+  def test_simplify(self):
+    x, y = self.x, self.y
+    self.assertEqual(((x + 1) * (x + 1) - x * x).simplify(), 1 + 2 * x)
+    self.assertEqual((x / 2 + x).simplify(), 1.5 * x)
+    self.assertEqual(((x | y) * 2 - (y | x)).simplify(), x | y)
+
+if __name__ == '__main__':
+  unittest.main()
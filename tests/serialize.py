@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+import symath
+import symath.serialize as serialize
+
+class TestSerialize(unittest.TestCase):
+
+  def setUp(self):
+    self.x, self.y, self.f = symath.symbols('x y f')
+    self.a = symath.wild('a')
+
+  def test_roundtrip(self):
+    exps = [
+        self.x + self.y * 3,
+        self.f(self.x, 2.5, symath.symbolic(True)),
+        (self.x + self.y)(self.a),
+        symath.stdops.LogicalAnd(self.x, self.y) >> 4,
+        self.x
+        ]
+    self.assertEqual(serialize.loads(serialize.dumps(exps)), exps)
+
+  def test_shared_nodes_written_once(self):
+    exp = self.x
+    for i in range(40):
+      exp = exp + exp
+
+    data = serialize.dumps([exp])
+    self.assertTrue(len(data) < 2000)
+    self.assertEqual(serialize.loads(data), [exp])
+
+  def test_symbol_domain(self):
+    n = symath.symbols('serialized_n', domain='integers')
+    n.is_bitvector = 32
+    data = serialize.dumps([n + 1])
+    exp, = serialize.loads(data)
+    self.assertEqual(exp, n + 1)
+
+    # a live symbol keeps its domain, loading doesn't change it
+    n.is_bitvector = 0
+    self.assertRaises(serialize.SerializationError, serialize.loads, data)
+    self.assertEqual(n.is_bitvector, 0)
+
+    # one that isn't live gets the domain it was saved with
+    del n, exp
+    exp, = serialize.loads(data)
+    self.assertEqual(exp.args[0].is_bitvector, 32)
+
+  def test_bad_kargs(self):
+    sym = symath.symbols('bad_kargs', default=symath.symbolic(1))
+    self.assertRaises(serialize.SerializationError, serialize.dumps, [sym])
+
+  def test_mapped(self):
+    exps = [self.x * i + self.y for i in range(100)]
+    fd, path = tempfile.mkstemp()
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        serialize.dump(exps, f)
+
+      mapped = serialize.MappedExpressions(path)
+      self.assertEqual(len(mapped), 100)
+      self.assertEqual(mapped[42], exps[42])
+      self.assertEqual(mapped[-1], exps[-1])
+      self.assertEqual(list(mapped), exps)
+      mapped.close()
+    finally:
+      os.remove(path)
+
+if __name__ == '__main__':
+  unittest.main()